@@ -0,0 +1,151 @@
+import logging
+import os
+import queue
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Pool of headless browsers for the stages that cannot run over plain HTTP.
+# Each worker thread owns one warmed-up Chrome and pulls URLs from a shared
+# queue, so browser work scales with the available cores instead of running
+# one tab at a time. Workers are recycled after `max_pages` pages or once the
+# resident memory of the browser (chromedriver and every Chrome process under
+# it) grows past `max_memory_mb`, and a browser that crashes is restarted and
+# the URL it was on is tried again. The memory check needs psutil; without
+# it workers are recycled by page count only.
+
+DEFAULT_SIZE = min(4, os.cpu_count() or 1)
+DEFAULT_MAX_PAGES = 200
+DEFAULT_MAX_MEMORY_MB = 1024
+
+_DONE = object()
+
+
+class _Worker:
+    def __init__(self, index, create_driver, warm_up, max_pages, max_memory_mb):
+        self.index = index
+        self.create_driver = create_driver
+        self.warm_up = warm_up
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.driver = None
+        self.pages = 0
+
+    def start(self):
+        self.driver = self.create_driver()
+        self.pages = 0
+        if self.warm_up:
+            self.warm_up(self.driver)
+        logging.info(f"Browser worker {self.index} started")
+
+    def quit(self):
+        if self.driver is None:
+            return
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.warning(f"Browser worker {self.index} did not quit cleanly: {e}")
+        self.driver = None
+
+    def alive(self):
+        try:
+            self.driver.execute_script('return 1')
+            return True
+        except Exception:
+            return False
+
+    def memory_mb(self):
+        if psutil is None:
+            return 0
+        try:
+            driver_process = psutil.Process(self.driver.service.process.pid)
+            processes = [driver_process] + driver_process.children(recursive=True)
+        except Exception:
+            return 0
+        used = 0
+        for process in processes:
+            try:
+                used += process.memory_info().rss
+            except psutil.Error:
+                pass  # Exited in the meantime
+        return used / 1024 ** 2
+
+    def run(self, func, item):
+        # Returns (item, result, error); a crashed browser gets one restart.
+        error = None
+        for attempt in range(2):
+            try:
+                if self.driver is None:
+                    self.start()
+                result = func(self.driver, item)
+            except Exception as e:
+                error = e
+                if self.driver is not None and self.alive():
+                    break
+                logging.warning(f"Browser worker {self.index} crashed on {item}: {e}")
+                self.quit()
+                continue
+            self.pages += 1
+            memory = self.memory_mb()
+            if self.pages >= self.max_pages or memory > self.max_memory_mb:
+                logging.info(f"Recycling browser worker {self.index} after {self.pages} pages at {memory:.0f} MB")
+                self.quit()
+            return item, result, None
+        return item, None, error
+
+
+class BrowserPool:
+    def __init__(self, create_driver, size=DEFAULT_SIZE, warm_up=None,
+                 max_pages=DEFAULT_MAX_PAGES, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+        # create_driver() returns a new WebDriver; warm_up(driver) prepares it
+        # (home page, cookies) before it is handed any work.
+        self.create_driver = create_driver
+        self.size = max(1, size)
+        self.warm_up = warm_up
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+
+    def map(self, func, items):
+        # Runs func(driver, item) for every item and yields (item, result,
+        # error) in completion order. Browsers are started on first use and
+        # shut down once the items run out.
+        tasks = queue.Queue(maxsize=self.size * 2)
+        results = queue.Queue()
+
+        def feed():
+            try:
+                for item in items:
+                    tasks.put(item)
+            except Exception as e:
+                logging.error(f"Error reading browser pool input: {e}")
+            finally:
+                for _ in range(self.size):
+                    tasks.put(_DONE)
+
+        def work(index):
+            worker = _Worker(index, self.create_driver, self.warm_up, self.max_pages, self.max_memory_mb)
+            try:
+                while True:
+                    item = tasks.get()
+                    if item is _DONE:
+                        break
+                    results.put(worker.run(func, item))
+            finally:
+                worker.quit()
+                results.put(_DONE)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        threads += [threading.Thread(target=work, args=(index,), daemon=True) for index in range(self.size)]
+        for thread in threads:
+            thread.start()
+
+        finished = 0
+        while finished < self.size:
+            result = results.get()
+            if result is _DONE:
+                finished += 1
+            else:
+                yield result
@@ -0,0 +1,158 @@
+import json
+import logging
+import sqlite3
+import time
+
+import delta
+from output import KEY, is_placeholder, variant_key
+
+# Run-to-run change events. The catalog index holds the last known price,
+# stock status and quantity of every (site, URL, SKU) in the same SQLite file
+# as the delta index. Rows are compared against it as they are written (the
+# feed is a sink of output.RowWriter), and every difference is appended at once
+# to <site>_changes.jsonl as one JSON event per line:
+#
+#   new       - a variant that was not in the index
+#   price     - its price changed
+#   stock     - its stock status flipped
+#   quantity  - its quantity changed
+#   removed   - a known variant that was not seen in this run (at finish())
+#
+# Variants are keyed like in the other sinks (output.KEY), so the "sku" of an
+# event is the variant name or position when the variant has no SKU.
+#
+# A feed is a file-like object for CrawlState.track(): its flush() commits the
+# index, so a resumed crawl does not report the variants it already saw, and
+# its name and fileno() are the events file's, which a resumed crawl cuts back
+# to its last commit like the CSV files.
+
+NEW = 'new'
+REMOVED = 'removed'
+PRICE = 'price'
+STOCK = 'stock'
+QUANTITY = 'quantity'
+
+# event -> output column
+TRACKED = {PRICE: 'Price', STOCK: 'Stock Status', QUANTITY: 'Quantity'}
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class ChangeFeed:
+    def __init__(self, site, events_file=None, path=delta.DEFAULT_PATH, batch_size=DEFAULT_BATCH_SIZE):
+        self.site = site
+        self.events_file = events_file or f"{site}_changes.jsonl"
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS catalog (
+                site TEXT,
+                url TEXT,
+                sku TEXT,
+                price TEXT,
+                stock TEXT,
+                quantity TEXT,
+                seen REAL,
+                PRIMARY KEY (site, url, sku)
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS feeds (
+                site TEXT PRIMARY KEY,
+                run REAL
+            )""")
+        self.conn.commit()
+        self.run = None
+        self.known = {}
+        self.urls = {}
+        self.pending = []
+        self.counts = {}
+        self.name = self.events_file
+        self.file = None
+        self.closed = True
+
+    def begin(self, resumed=False):
+        # A resumed crawl keeps its run, so what it saw before counts as seen
+        row = self.conn.execute('SELECT run FROM feeds WHERE site = ?', (self.site,)).fetchone()
+        if resumed and row:
+            self.run = row[0]
+        else:
+            self.run = time.time()
+            self.conn.execute('INSERT OR REPLACE INTO feeds VALUES (?, ?)', (self.site, self.run))
+            self.conn.commit()
+        self.known = {}
+        self.urls = {}
+        for url, sku, price, stock, quantity, seen in self.conn.execute(
+                'SELECT url, sku, price, stock, quantity, seen FROM catalog WHERE site = ?', (self.site,)):
+            self.known[(url, sku)] = [price, stock, quantity, seen]
+            self.urls.setdefault(url, set()).add(sku)
+        self.file = open(self.events_file, 'a', encoding='utf-8')
+        self.closed = False
+        logging.info(f"Change feed for {self.site}: {len(self.known)} known variants")
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def emit(self, event, url, sku, old=None, new=None):
+        record = {'site': self.site, 'event': event, 'url': url, 'sku': sku, 'old': old, 'new': new,
+                  'at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.counts[event] = self.counts.get(event, 0) + 1
+
+    def write(self, row):
+        # row: a dict keyed by the output columns
+        if is_placeholder(row):
+            return  # The row of a page that could not be read
+        url = row['URL']
+        sku = row.get(KEY) or variant_key(row)
+        values = [str(row.get(column, '')) for column in TRACKED.values()]
+        key = (url, sku)
+        old = self.known.get(key)
+        if old is None:
+            self.emit(NEW, url, sku, new=dict(zip(TRACKED, values)))
+        elif old[3] != self.run:
+            for event, before, after in zip(TRACKED, old, values):
+                if before != after:
+                    self.emit(event, url, sku, before, after)
+        self.known[key] = values + [self.run]
+        self.urls.setdefault(url, set()).add(sku)
+        self.pending.append((self.site, url, sku, *values, self.run))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def keep(self, url):
+        # A page that failed this run: its variants are not reported removed
+        for sku in self.urls.get(url, ()):
+            values = self.known[(url, sku)]
+            if values[3] != self.run:
+                values[3] = self.run
+                self.pending.append((self.site, url, sku, *values))
+
+    def flush(self):
+        if self.closed:
+            return
+        self.file.flush()
+        self.conn.executemany('INSERT OR REPLACE INTO catalog VALUES (?, ?, ?, ?, ?, ?, ?)', self.pending)
+        self.conn.commit()
+        self.pending = []
+
+    def finish(self, report_removed=True):
+        # report_removed=False when parts of the site could not be crawled
+        self.flush()
+        if report_removed:
+            removed = [(key, values) for key, values in self.known.items() if values[3] != self.run]
+            for (url, sku), values in removed:
+                self.emit(REMOVED, url, sku, old=dict(zip(TRACKED, values)))
+            self.conn.executemany('DELETE FROM catalog WHERE site = ? AND url = ? AND sku = ?',
+                                  [(self.site, url, sku) for (url, sku), values in removed])
+            self.conn.commit()
+        self.close()
+        logging.info(f"Change feed for {self.site}: {self.counts or 'no changes'} written to {self.events_file}")
+
+    def close(self):
+        self.flush()
+        self.closed = True
+        if self.file:
+            self.file.close()
+        self.conn.close()
+
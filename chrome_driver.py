@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import SessionNotCreatedException
+
+# Starts the scrapers' Chrome instances.
+#
+# The chromedriver binary is resolved once and remembered. The path comes from
+# CHROMEDRIVER_PATH, else from the local cache file written by an earlier run,
+# and only when neither points at an existing file is webdriver_manager asked
+# (which checks the network for the matching driver version). If that lookup
+# fails, e.g. offline, Selenium's own driver discovery is used instead. When
+# Chrome has updated past the remembered driver the session cannot start;
+# the cache file is then dropped and the driver resolved once more.
+#
+# Browsers use a lean profile unless SCRAPER_LEAN_BROWSER=0: pages load with
+# the eager strategy (driver.get returns at DOMContentLoaded) and images,
+# fonts, media and known tracking hosts are blocked through the DevTools
+# protocol. The bytes each page transferred by the time get() returns and the
+# requests the profile blocked (from Chrome's performance log) are recorded.
+# Bytes saved are only known by loading the same URL in both profiles, which
+# measure_savings does; with SCRAPER_MEASURE_SAVINGS=1 it runs on the first
+# lean page of every host, when a browser slot is free.
+#
+# When run.py runs several sites at once it shares a semaphore through
+# limit_browsers(), capping how many browsers are open across all processes.
+
+CACHE_FILE = '.chromedriver_path'
+
+LEAN = os.environ.get('SCRAPER_LEAN_BROWSER', '1') != '0'
+MEASURE_SAVINGS = os.environ.get('SCRAPER_MEASURE_SAVINGS', '0') == '1'
+BLOCKED_TYPES = ('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico',
+                 'woff', 'woff2', 'ttf', 'otf', 'eot', 'mp4', 'webm', 'mp3')
+BLOCKED_HOSTS = ('google-analytics.com', 'googletagmanager.com', 'doubleclick.net',
+                 'facebook.net', 'facebook.com', 'connect.facebook.net', 'hotjar.com',
+                 'clarity.ms', 'bing.com', 'tiktok.com', 'pinterest.com', 'trustpilot.com',
+                 'klaviyo.com', 'cookiebot.com', 'youtube.com', 'vimeo.com')
+
+PAGE_WEIGHT_SCRIPT = """
+    const entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+    return entries.reduce((total, entry) => total + (entry.transferSize || 0), 0);
+"""
+
+BROWSER_SLOT_TIMEOUT = 900  # seconds to wait for a slot before starting anyway
+LOAD_TIMEOUT = 30  # seconds measure_savings waits for a page to finish loading
+
+_path = None
+_refreshed = False
+_lock = threading.Lock()
+_browser_slots = None
+_stats = {'pages': 0, 'bytes': 0, 'blocked': 0, 'sampled': 0, 'saved': 0}
+_sampled = set()
+
+
+def _cached_path():
+    path = os.environ.get('CHROMEDRIVER_PATH')
+    if path and os.path.isfile(path):
+        return path
+    try:
+        with open(CACHE_FILE, 'r') as file:
+            path = file.read().strip()
+    except OSError:
+        return None
+    return path if path and os.path.isfile(path) else None
+
+
+def driver_path(refresh=False):
+    # Returns the chromedriver path, or None to let Selenium locate one.
+    # refresh=True: the remembered driver could not start a session, so the
+    # env and cached paths are ignored from now on.
+    global _path, _refreshed
+    with _lock:
+        if refresh and not _refreshed:
+            _refreshed = True
+            _path = None
+            try:
+                os.remove(CACHE_FILE)
+            except OSError:
+                pass
+            logging.warning("Chromedriver could not start a session, resolving it again")
+        elif _refreshed or (_path and os.path.isfile(_path)):
+            return _path
+        else:
+            _path = _cached_path()
+            if _path:
+                return _path
+        try:
+            from webdriver_manager.chrome import ChromeDriverManager
+            _path = ChromeDriverManager().install()
+        except Exception as e:
+            logging.warning(f"Could not resolve chromedriver with webdriver_manager: {e}")
+            return None
+        try:
+            with open(CACHE_FILE, 'w') as file:
+                file.write(_path)
+        except OSError as e:
+            logging.warning(f"Could not cache chromedriver path: {e}")
+        logging.info(f"Resolved chromedriver at {_path}")
+        return _path
+
+
+def service(refresh=False):
+    path = driver_path(refresh)
+    return Service(path) if path else Service()
+
+
+def blocked_urls(types=BLOCKED_TYPES, hosts=BLOCKED_HOSTS):
+    # URL patterns for Network.setBlockedURLs; extensions may carry a query
+    return [f"*.{extension}*" for extension in types] + [f"*{host}/*" for host in hosts]
+
+
+def limit_browsers(slots):
+    # slots: a (multiprocessing) semaphore, one unit per browser allowed
+    global _browser_slots
+    _browser_slots = slots
+
+
+def _acquire_slot():
+    slots = _browser_slots
+    if slots is None:
+        return None
+    if not slots.acquire(timeout=BROWSER_SLOT_TIMEOUT):
+        # A process holding browsers may be waiting on us; do not deadlock
+        logging.warning("No browser slot became free, starting a browser over the cap")
+        return None
+    return slots
+
+
+def start(options, lean=None, slot=True, record=True):
+    # Starts Chrome with the scraper's options, applying the lean profile.
+    # slot=False: the caller holds the browser slot. record=False: pages
+    # are not counted in the stats (measurement browsers).
+    lean = LEAN if lean is None else lean
+    if lean:
+        options.page_load_strategy = 'eager'
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    slots = _acquire_slot() if slot else None
+    try:
+        try:
+            driver = webdriver.Chrome(service=service(), options=options)
+        except SessionNotCreatedException as e:
+            # Usually Chrome updated and the remembered driver is too old
+            logging.warning(f"Chrome session not created: {e}")
+            driver = webdriver.Chrome(service=service(refresh=True), options=options)
+    except Exception:
+        if slots is not None:
+            slots.release()
+        raise
+    if lean:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_urls()})
+
+    get = driver.get
+
+    def get_and_record(url):
+        get(url)
+        if record:
+            _record_page(driver, url, lean)
+            if lean and MEASURE_SAVINGS:
+                _sample_savings(url)
+
+    driver.get = get_and_record
+
+    quit = driver.quit
+    released = []
+
+    def quit_and_release():
+        try:
+            quit()
+        finally:
+            if slots is not None and not released:
+                released.append(True)
+                slots.release()
+
+    driver.quit = quit_and_release
+    return driver
+
+
+def page_weight(driver):
+    try:
+        return driver.execute_script(PAGE_WEIGHT_SCRIPT) or 0
+    except Exception:
+        return 0
+
+
+def _measure_options():
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-dev-shm-usage")
+    return options
+
+
+def _blocked_requests(driver):
+    # Requests refused by Network.setBlockedURLs since the last call
+    try:
+        entries = driver.get_log('performance')
+    except Exception:
+        return 0
+    blocked = 0
+    for entry in entries:
+        message = json.loads(entry['message']).get('message', {})
+        if message.get('method') == 'Network.loadingFailed' and message.get('params', {}).get('blockedReason'):
+            blocked += 1
+    return blocked
+
+
+def _record_page(driver, url, lean):
+    transferred = page_weight(driver)
+    blocked = _blocked_requests(driver) if lean else 0
+    with _lock:
+        _stats['pages'] += 1
+        _stats['bytes'] += transferred
+        _stats['blocked'] += blocked
+    logging.info(f"Page {url} transferred {transferred} bytes, {blocked} requests blocked")
+
+
+def _wait_for_load(driver, timeout=LOAD_TIMEOUT):
+    # Eager loads return at DOMContentLoaded; weigh the page once it loaded
+    try:
+        WebDriverWait(driver, timeout).until(
+            lambda driver: driver.execute_script('return document.readyState') == 'complete')
+    except Exception:
+        logging.warning(f"Page did not finish loading within {timeout}s, weighing it as it is")
+
+
+def _sample_savings(url):
+    # The first lean page of every host, measured once a browser slot is free
+    host = urlsplit(url).netloc
+    slots = _browser_slots
+    with _lock:
+        if host in _sampled:
+            return
+        if slots is not None and not slots.acquire(False):
+            return  # Tried again on the host's next page
+        _sampled.add(host)
+    try:
+        measure_savings(url, slot=False)
+    except Exception as e:
+        logging.warning(f"Could not measure the lean profile savings on {url}: {e}")
+    finally:
+        if slots is not None:
+            slots.release()
+
+
+def measure_savings(url, slot=True):
+    # Loads url with a full and with a lean browser, each until the load
+    # event, and returns the bytes the lean profile saved on it.
+    weights = {}
+    for lean in (False, True):
+        driver = start(_measure_options(), lean=lean, slot=slot, record=False)
+        try:
+            driver.get(url)
+            _wait_for_load(driver)
+            weights[lean] = page_weight(driver)
+        finally:
+            driver.quit()
+    saved = weights[False] - weights[True]
+    with _lock:
+        _stats['sampled'] += 1
+        _stats['saved'] += saved
+    logging.info(f"Lean profile on {url}: {weights[False]} -> {weights[True]} bytes ({saved} saved)")
+    return saved
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
+
+
+def log_stats():
+    values = stats()
+    if not values['pages']:
+        return
+    savings = ""
+    if values['sampled']:
+        savings = (f", lean profile saved {values['saved'] / values['sampled']:.0f} bytes per page "
+                   f"on {values['sampled']} sampled pages")
+    logging.info(f"Browser pages: {values['pages']}, {values['bytes'] / values['pages']:.0f} bytes avg, "
+                 f"{values['blocked']} requests blocked{savings}")
@@ -0,0 +1,188 @@
+import glob
+import logging
+import os
+import re
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from output import is_placeholder
+
+# Columnar export of the detail rows, next to the CSV files. Rows are typed
+# as they are written (numeric prices and quantities, dictionary encoded
+# brand and stock status) and land in a hive style dataset with one
+# partition per site:
+#
+#   catalog_parquet/site=<site>/catalog.parquet
+#
+# During the crawl row groups are written to part files under
+# site=<site>/_parts/ (ignored by dataset readers). A part is closed on every
+# flush(), which CrawlState calls before it commits, so a resumed crawl keeps
+# the parts of the rows it already has. finish() compacts the parts into
+# catalog.parquet, replacing the previous run's file in one step.
+#
+# pyarrow is optional: without it (or with SCRAPER_PARQUET=0) no sink is
+# created and the crawl writes CSV only.
+
+DEFAULT_DIRECTORY = 'catalog_parquet'
+ROW_GROUP_SIZE = 10000
+ENABLED = pq is not None and os.environ.get('SCRAPER_PARQUET', '1') != '0'
+
+if pa is not None:
+    CATEGORY = pa.dictionary(pa.int32(), pa.string())
+    SCHEMA = pa.schema([
+        ('title', pa.string()),
+        ('brand', CATEGORY),
+        ('variant', pa.string()),
+        ('sku', pa.string()),
+        ('price', pa.float64()),
+        ('stock', CATEGORY),
+        ('quantity', pa.int64()),
+        ('url', pa.string()),
+        ('scraped_at', pa.timestamp('ms')),
+    ])
+
+
+# A space (also non-breaking or narrow) between digit groups: "1 299,00 kr"
+THOUSANDS_SPACE = re.compile(r'(?<=\d)[ \u00a0\u202f](?=\d{3}(?!\d))')
+# Sale prices read "Før 499,95 kr Nu 399,95 kr" (before / now)
+BEFORE = re.compile(r'\b(?:før|was|tidligere|normalpris)\b', re.I)
+NOW = re.compile(r'\b(?:nu|now)\b', re.I)
+
+
+def parse_price(text):
+    # "Rs. 1,234.00", "123.00 kr", "1.234,00 kr", "1 299,00 kr", "249" ->
+    # float; of a before/now pair the current price. None when unsure.
+    text = THOUSANDS_SPACE.sub('', str(text))
+    now = list(NOW.finditer(text))
+    if now:
+        text = text[now[-1].end():]
+    tokens = re.findall(r'\d[\d.,]*', text)
+    if not tokens:
+        return None
+    if len(tokens) > 1 and not now and not BEFORE.search(text):
+        return None  # Several numbers and no telling which is the price
+    digits = (tokens[0] if now else tokens[-1]).rstrip('.,')
+    # A final separator followed by one or two digits is the decimal point,
+    # any other separator groups thousands
+    match = re.match(r'^(.*?)[.,](\d{1,2})$', digits)
+    whole, fraction = match.groups() if match else (digits, '0')
+    groups = re.split(r'[.,]', whole)
+    if any(len(group) != 3 for group in groups[1:]) or len(set(re.findall(r'[.,]', whole))) > 1:
+        return None  # Not a number we can read unambiguously
+    return float(f"{''.join(groups)}.{fraction}")
+
+
+def parse_quantity(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def sink(site, resumed=False, directory=DEFAULT_DIRECTORY):
+    # A ParquetSink for output.RowWriter, or None when the export is off
+    if not ENABLED:
+        return None
+    parquet = ParquetSink(site, directory)
+    parquet.begin(resumed)
+    return parquet
+
+
+class ParquetSink:
+    def __init__(self, site, directory=DEFAULT_DIRECTORY, row_group_size=ROW_GROUP_SIZE):
+        self.site = site
+        self.partition = os.path.join(directory, f"site={site}")
+        self.parts = os.path.join(self.partition, '_parts')
+        self.row_group_size = row_group_size
+        self.columns = {name: [] for name in SCHEMA.names}
+        self.buffered = 0
+        self.writer = None
+        self.part = None
+        self.rows = 0
+        self.closed = True
+
+    def begin(self, resumed=False):
+        os.makedirs(self.parts, exist_ok=True)
+        # Unfinished parts never got their footer; a new crawl drops all parts
+        for path in glob.glob(os.path.join(self.parts, '*.tmp' if resumed else '*')):
+            os.remove(path)
+        self.closed = False
+
+    def write(self, row):
+        # row: a dict keyed by the output columns
+        if is_placeholder(row):
+            return
+        values = self.columns
+        values['title'].append(row.get('Title', row.get('Product Name')))
+        values['brand'].append(row.get('Brand'))
+        values['variant'].append(row.get('Variants'))
+        values['sku'].append(row.get('SKU'))
+        values['price'].append(parse_price(row.get('Price', '')))
+        values['stock'].append(row.get('Stock Status'))
+        values['quantity'].append(parse_quantity(row.get('Quantity')))
+        values['url'].append(row.get('URL'))
+        values['scraped_at'].append(int(time.time() * 1000))
+        self.buffered += 1
+        if self.buffered >= self.row_group_size:
+            self.write_row_group()
+
+    def keep(self, url):
+        pass  # The file holds this run's rows only
+
+    def write_row_group(self):
+        if not self.buffered:
+            return
+        if self.writer is None:
+            self.part = os.path.join(self.parts, f"part-{time.time_ns()}.parquet.tmp")
+            self.writer = pq.ParquetWriter(self.part, SCHEMA, compression='zstd')
+        table = pa.Table.from_pydict(self.columns, schema=SCHEMA)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows += self.buffered
+        self.columns = {name: [] for name in SCHEMA.names}
+        self.buffered = 0
+
+    def flush(self):
+        # Writes what is buffered and closes the part, so it survives a crash
+        if self.closed:
+            return
+        self.write_row_group()
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.part, self.part[:-len('.tmp')])
+            self.writer = None
+
+    def finish(self):
+        self.flush()
+        self.closed = True
+        parts = sorted(glob.glob(os.path.join(self.parts, '*.parquet')))
+        target = os.path.join(self.partition, 'catalog.parquet')
+        # Dataset readers skip files starting with an underscore
+        temporary = os.path.join(self.partition, '_catalog.parquet.tmp')
+        with pq.ParquetWriter(temporary, SCHEMA, compression='zstd') as writer:
+            # Small parts are merged into full size row groups
+            batches = []
+            pending = 0
+            for part in parts:
+                for batch in pq.ParquetFile(part).iter_batches(batch_size=self.row_group_size):
+                    batches.append(batch)
+                    pending += batch.num_rows
+                    if pending >= self.row_group_size:
+                        writer.write_table(pa.Table.from_batches(batches, schema=SCHEMA),
+                                           row_group_size=self.row_group_size)
+                        batches = []
+                        pending = 0
+            if batches:
+                writer.write_table(pa.Table.from_batches(batches, schema=SCHEMA))
+        os.replace(temporary, target)
+        for part in parts:
+            os.remove(part)
+        logging.info(f"Parquet catalog of {self.site} written to {target} ({self.rows} rows this process)")
+
+    def close(self):
+        self.flush()
+        self.closed = True
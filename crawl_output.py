@@ -0,0 +1,72 @@
+import logging
+
+import columnar
+from change_feed import ChangeFeed
+from output import RowWriter
+from storage import Store
+
+# The sinks of one crawl (change feed, store, Parquet export), opened and
+# finished in one place for every scraper:
+#
+#   state = CrawlState(output_file)
+#   with CrawlOutput(SITE, state, delta) as crawl:
+#       with open(output_file, 'a' if crawl.resumed else 'w', ...) as csvfile:
+#           writer = crawl.writer(csv.DictWriter(csvfile, fieldnames=fieldnames))
+#           crawl.track(csvfile)
+#           ...
+#
+# Entering begins the crawl state, if there is one, and opens the sinks for
+# it. Leaving the block normally finishes everything; a partial crawl (URLs
+# left pending or waiting for the variant stage, or `partial` set by the
+# caller) reports no removed products and prunes nothing from the store.
+# Leaving with an exception only closes everything, so the next run resumes
+# the crawl.
+
+
+class CrawlOutput:
+    def __init__(self, site, state=None, delta=None):
+        self.site = site
+        self.state = state
+        self.delta = delta
+        self.resumed = False
+        self.partial = 0
+        self.feed = self.store = self.parquet = None
+        self.sinks = []
+
+    def __enter__(self):
+        self.resumed = self.state.begin() if self.state else False
+        self.feed = ChangeFeed(self.site)
+        self.feed.begin(self.resumed)
+        self.store = Store(self.site)
+        self.parquet = columnar.sink(self.site, self.resumed)
+        self.sinks = [sink for sink in (self.feed, self.store, self.parquet) if sink is not None]
+        return self
+
+    def writer(self, writer, fieldnames=None):
+        return RowWriter(writer, self.sinks, fieldnames)
+
+    def track(self, *files):
+        # The output files the crawl state flushes before each commit
+        if self.state:
+            self.state.track(*files, *self.sinks)
+
+    def __exit__(self, error_type, error, traceback):
+        if error_type is not None:
+            for part in [self.state, self.delta] + self.sinks:
+                if part is not None:
+                    part.close()
+            return False
+        # Products of pages that were never reached are not known to be gone
+        partial = self.partial + (self.state.unfinished() if self.state else 0)
+        if partial:
+            logging.warning(f"{partial} pages of {self.site} were not crawled, removed products are kept")
+        since = self.state.started_at if self.state else None
+        if self.state:
+            self.state.finish()
+        self.feed.finish(report_removed=not partial)
+        self.store.finish(since, prune=not partial)
+        if self.parquet:
+            self.parquet.finish()
+        if self.delta:
+            self.delta.close()
+        return False
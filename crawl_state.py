@@ -0,0 +1,164 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Persistent per-URL crawl progress, so an interrupted detail crawl resumes
+# where it stopped instead of starting over. Every crawl is keyed by its
+# output file. URLs move from pending to done, failed or variant; status
+# changes are buffered and committed in batches, right after the output
+# files tracked with track() have been flushed, so a committed "done" always
+# has its row on disk. Each commit also records the size of the tracked
+# output files; a resumed crawl cuts them back to it, so rows written after
+# the last commit (whose URLs are fetched again) are not appended twice. A
+# crawl that ran to the end is finished(); the next run with the same key
+# then starts from scratch.
+
+DEFAULT_PATH = 'crawl_state.sqlite'
+DEFAULT_BATCH_SIZE = 100
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+VARIANT = 'variant'
+
+
+class CrawlState:
+    def __init__(self, crawl, path=DEFAULT_PATH, batch_size=DEFAULT_BATCH_SIZE):
+        self.crawl = crawl
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS crawls (
+                crawl TEXT PRIMARY KEY,
+                started_at REAL,
+                finished_at REAL
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                crawl TEXT,
+                url TEXT,
+                status TEXT,
+                updated_at REAL,
+                PRIMARY KEY (crawl, url)
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS offsets (
+                crawl TEXT,
+                path TEXT,
+                size INTEGER,
+                PRIMARY KEY (crawl, path)
+            )""")
+        self.conn.commit()
+        self.statuses = {}
+        self.pending = []
+        self.files = []
+        self.started_at = None
+
+    def begin(self):
+        # Returns True when an unfinished crawl is resumed, False when a new
+        # one starts (its previous URL statuses are cleared).
+        with self.lock:
+            row = self.conn.execute('SELECT started_at, finished_at FROM crawls WHERE crawl = ?',
+                                    (self.crawl,)).fetchone()
+            resumed = row is not None and row[1] is None
+            if resumed:
+                self.started_at = row[0]
+                self.statuses = dict(self.conn.execute(
+                    'SELECT url, status FROM urls WHERE crawl = ?', (self.crawl,)))
+                offsets = self.conn.execute('SELECT path, size FROM offsets WHERE crawl = ?',
+                                            (self.crawl,)).fetchall()
+            else:
+                self.started_at = time.time()
+                self.conn.execute('DELETE FROM urls WHERE crawl = ?', (self.crawl,))
+                self.conn.execute('DELETE FROM offsets WHERE crawl = ?', (self.crawl,))
+                self.conn.execute('INSERT OR REPLACE INTO crawls VALUES (?, ?, NULL)', (self.crawl, self.started_at))
+                self.conn.commit()
+                self.statuses = {}
+        if resumed:
+            for path, size in offsets:
+                if os.path.exists(path) and os.path.getsize(path) > size:
+                    logging.info(f"Dropping {os.path.getsize(path) - size} bytes written to {path} after the last commit")
+                    os.truncate(path, size)
+            done = sum(1 for status in self.statuses.values() if status != PENDING)
+            logging.info(f"Resuming {self.crawl}: {done} of {len(self.statuses)} known URLs already handled")
+        return resumed
+
+    def track(self, *files):
+        # The output files to flush before each commit; None is skipped.
+        self.files = [file for file in files if file is not None]
+
+    def status(self, url):
+        with self.lock:
+            return self.statuses.get(url)
+
+    def remaining(self, urls):
+        # Yields the URLs that still need work, recording new ones as pending.
+        skipped = 0
+        for url in urls:
+            status = self.status(url)
+            if status in (DONE, FAILED, VARIANT):
+                skipped += 1
+                continue
+            if status is None:
+                self.mark(url, PENDING)
+            yield url
+        if skipped:
+            logging.info(f"Skipped {skipped} URLs already handled in {self.crawl}")
+
+    def mark(self, url, status):
+        with self.lock:
+            self.statuses[url] = status
+            self.pending.append((self.crawl, url, status, time.time()))
+            # Commits happen on the thread writing the output files, which
+            # is the one recording results; pending marks come from the
+            # thread feeding URLs to the workers.
+            if status != PENDING and len(self.pending) >= self.batch_size:
+                self._commit()
+
+    def _commit(self):
+        offsets = []
+        for file in self.files:
+            if not file.closed:
+                file.flush()
+            if hasattr(file, 'fileno'):  # Output files, not the other sinks
+                # A file closed before the commit was flushed when it closed
+                offsets.append((self.crawl, os.path.abspath(file.name), os.path.getsize(file.name)))
+        self.conn.executemany('INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?)', self.pending)
+        self.conn.executemany('INSERT OR REPLACE INTO offsets VALUES (?, ?, ?)', offsets)
+        self.conn.commit()
+        self.pending = []
+
+    def flush(self):
+        with self.lock:
+            self._commit()
+
+    def counts(self):
+        with self.lock:
+            counts = {}
+            for status in self.statuses.values():
+                counts[status] = counts.get(status, 0) + 1
+            return counts
+
+    def unfinished(self):
+        # How many URLs are still pending or waiting for the variant stage
+        counts = self.counts()
+        return counts.get(PENDING, 0) + counts.get(VARIANT, 0)
+
+    def finish(self):
+        with self.lock:
+            self._commit()
+            self.conn.execute('UPDATE crawls SET finished_at = ? WHERE crawl = ?', (time.time(), self.crawl))
+            self.conn.commit()
+            self.files = []
+            self.conn.close()
+        logging.info(f"Crawl {self.crawl} finished: {self.counts()}")
+
+    def close(self):
+        with self.lock:
+            self._commit()
+            self.files = []
+            self.conn.close()
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+# Incremental crawling. The index remembers, per product URL, a fingerprint
+# of what the product looked like and the rows written for it last time.
+# When the fingerprint is unchanged the detail fetch is skipped and the old
+# rows are carried forward. Fingerprints, cheapest first:
+#
+#   lastmod      - the sitemap <lastmod> of the URL (no request at all)
+#   fingerprint  - a hash of change markers in the fetched data, e.g. the
+#                  Shopify updated_at values (skips the follow-up requests)
+
+DEFAULT_PATH = 'product_index.sqlite'
+DEFAULT_BATCH_SIZE = 100
+
+
+def fingerprint(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class DeltaIndex:
+    def __init__(self, crawl, path=DEFAULT_PATH, batch_size=DEFAULT_BATCH_SIZE):
+        self.crawl = crawl
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                crawl TEXT,
+                url TEXT,
+                lastmod TEXT,
+                fingerprint TEXT,
+                rows TEXT,
+                updated_at REAL,
+                PRIMARY KEY (crawl, url)
+            )""")
+        self.conn.commit()
+        self.pending = []
+        self.carried = 0
+        self.checked = 0
+
+    def carry(self, url, lastmod='', fingerprint=''):
+        # Returns last run's rows when the product is unchanged, else None.
+        if not lastmod and not fingerprint:
+            return None
+        with self.lock:
+            self.checked += 1
+            row = self.conn.execute('SELECT lastmod, fingerprint, rows FROM products WHERE crawl = ? AND url = ?',
+                                    (self.crawl, url)).fetchone()
+        if row is None:
+            return None
+        old_lastmod, old_fingerprint, rows = row
+        if (lastmod and lastmod == old_lastmod) or (fingerprint and fingerprint == old_fingerprint):
+            with self.lock:
+                self.carried += 1
+            return json.loads(rows)
+        return None
+
+    def record(self, url, rows, lastmod='', fingerprint=''):
+        with self.lock:
+            self.pending.append((self.crawl, url, lastmod or '', fingerprint or '', json.dumps(rows), time.time()))
+            if len(self.pending) >= self.batch_size:
+                self._commit()
+
+    def _commit(self):
+        self.conn.executemany('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?)', self.pending)
+        self.conn.commit()
+        self.pending = []
+
+    def close(self):
+        with self.lock:
+            self._commit()
+            self.conn.close()
+        logging.info(f"Incremental crawl of {self.crawl}: {self.carried} unchanged products carried forward "
+                     f"({self.checked} lookups)")
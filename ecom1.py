@@ -1,18 +1,24 @@
 import csv
 import json
-import os
 import re
 import requests
 import logging
-from selenium import webdriver
+import threading
+import http_client
+import sitemap
+import pipeline
+import frontier
+from fetch_engine import FetchEngine
+from crawl_state import CrawlState, DONE, FAILED
+from crawl_output import CrawlOutput
+from delta import DeltaIndex, fingerprint
+from retry import RetryPolicy
+import html_parser
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-import time
-from bs4 import BeautifulSoup
+import chrome_driver
+import wait_strategy
+from urllib.parse import urlsplit
 
 # Configure logging
 logging.basicConfig(
@@ -22,7 +28,22 @@ logging.basicConfig(
 )
 
 class MorfarsScraper:
+    # Key of the site in the change feed and the store
+    SITE = 'morfars'
+    # A listing page is ready once its product cards are rendered
+    LISTING_READY = wait_strategy.Ready('.product-card__figure a', timeout=10)
+
     def __init__(self):
+        self._driver = None
+
+    @property
+    def driver(self):
+        # Chrome is only started once a stage actually needs the browser
+        if self._driver is None:
+            self._driver = self.new_driver()
+        return self._driver
+
+    def new_driver(self):
         options = Options()
         # ****************** Use this for server hosting ***********************
         options.add_argument("--headless") 
@@ -31,25 +52,22 @@ class MorfarsScraper:
         options.add_argument("--disable-dev-shm-usage")
         # **********************************************************************
         
-        self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+        driver = chrome_driver.start(options)
         logging.info("Initialized WebDriver")
+        return driver
 
-    def extract_product_links(self, url, output_file):
-        def extract_links_from_page(url):
-            self.driver.get(url)
-            time.sleep(5)
-            product_elements = self.driver.find_elements(By.CSS_SELECTOR, '.product-card__figure a')
-            product_links = [element.get_attribute('href') for element in product_elements if element.get_attribute('href')]
-
-            with open(output_file, "a", newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=['Product Link'])
-                if csvfile.tell() == 0:  # Check if the file is empty to write the header
-                    writer.writeheader()
-                for link in product_links:
-                    writer.writerow({'Product Link': link})
-            
-            logging.info(f"Extracted {len(product_links)} product links from {url}")
-            return product_links
+    def iter_product_links(self, url):
+        # Yields (product_url, lastmod) as links are found: from the Shopify
+        # sitemaps, else by paging through the collection in the browser.
+        count = 0
+        for link, lastmod in sitemap.discover(url, sitemap_filter=lambda u: 'sitemap_products' in u,
+                                              url_filter=lambda u: '/products/' in u):
+            count += 1
+            yield link, lastmod
+        if count:
+            logging.info(f"Extracted {count} product links from the sitemap of {url}")
+            return
+        logging.info(f"No product sitemap found for {url}, falling back to browser pagination")
 
         def get_next_page_url():
             try:
@@ -60,66 +78,136 @@ class MorfarsScraper:
             except:
                 return None
 
-        def extract_all_product_links(start_url):
-            all_links = []
-            
-            # Check if the output file exists and delete it
-            if os.path.exists(output_file):
-                os.remove(output_file)
-            
-            self.driver.get(start_url)
-            while True:
-                product_links = extract_links_from_page(self.driver.current_url)
-                all_links.extend(product_links)
-                next_page_url = get_next_page_url()
-                if next_page_url:
-                    self.driver.get(next_page_url)
-                    time.sleep(5)
-                else:
-                    break
-            logging.info(f"Total product links extracted: {len(all_links)}")
-            return all_links
+        # Each page is loaded once; the next link is read from the loaded page
+        page_url = url
+        while page_url:
+            wait_strategy.load(self.driver, page_url, self.LISTING_READY, 'listing')
+            product_elements = self.driver.find_elements(By.CSS_SELECTOR, '.product-card__figure a')
+            product_links = [element.get_attribute('href') for element in product_elements if element.get_attribute('href')]
+            logging.info(f"Extracted {len(product_links)} product links from {page_url}")
+            for link in product_links:
+                yield link, ''
+            page_url = get_next_page_url()
 
-        extract_all_product_links(url)
-        
-    def extract_product_details(self, product_urls_file, output_file):
-        def fetch_stock_status(product_url):
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+    def extract_product_links(self, url, output_file):
+        count = pipeline.save_links(frontier.unique_links(self.iter_product_links(url)), output_file)
+        logging.info(f"Total product links extracted: {count}")
 
-            try:
-                response = requests.get(product_url, headers=headers)
-                response.raise_for_status() 
+    def run_pipeline(self, url, output_file, product_urls_file=None, per_host_limit=8, incremental=False):
+        # Streaming mode: details are extracted while links are still being
+        # discovered; product_urls_file, if given, is kept as a checkpoint.
+        lastmods = {}
+        links = frontier.unique_links(self.iter_product_links(url))
+        product_urls = pipeline.stream(links, checkpoint=product_urls_file, lastmods=lastmods)
+        self.extract_product_details(product_urls_file, output_file, per_host_limit, product_urls=product_urls,
+                                     incremental=incremental, lastmods=lastmods)
 
-                soup = BeautifulSoup(response.content, 'html.parser')
-                stock_status_element = soup.select_one('.product-info__inventory .text-with-icon')
-                if stock_status_element:
-                    stock_status = stock_status_element.get_text(strip=True)
-                else:
-                    sold_out_badge = soup.select_one('.badge--sold-out')
-                    if sold_out_badge and sold_out_badge.get_text(strip=True):
-                        stock_status = sold_out_badge.get_text(strip=True)
-                    else:
-                        stock_status = 'N/A'
-                if stock_status in ['UDSOLGT', 'Udsolgt']:
-                    available = 'Out of Stock'
+    def extract_product_details(self, product_urls_file, output_file, per_host_limit=8, product_urls=None,
+                                incremental=False, lastmods=None):
+        # Incremental mode re-extracts only products whose sitemap lastmod or
+        # Shopify updated_at changed since the last run into output_file.
+        delta = DeltaIndex(output_file) if incremental else None
+        if lastmods is None:
+            lastmods = pipeline.read_lastmods(product_urls_file) if incremental and product_urls_file else {}
+
+        stock_pages = {}
+        stock_pages_lock = threading.Lock()
+
+        stock_page_parts = html_parser.ParseOnly(
+            classes=['product-info__inventory', 'badge--sold-out'],
+            attrs={'type': 'application/ld+json'})
+
+        def parse_stock_page(response):
+            return html_parser.extract(response.content, read_stock_page, only=stock_page_parts)
+
+        def read_stock_page(soup):
+            stock_status_element = soup.select_one('.product-info__inventory .text-with-icon')
+            if stock_status_element:
+                stock_status = stock_status_element.get_text(strip=True)
+            else:
+                sold_out_badge = soup.select_one('.badge--sold-out')
+                if sold_out_badge and sold_out_badge.get_text(strip=True):
+                    stock_status = sold_out_badge.get_text(strip=True)
                 else:
-                    available = 'In Stock'
+                    stock_status = 'N/A'
+            if stock_status in ['UDSOLGT', 'Udsolgt']:
+                available = 'Out of Stock'
+            else:
+                available = 'In Stock'
+
+            # Variant level availability from the structured data offers, keyed
+            # by variant id (from the offer URL) and by SKU.
+            variants = {}
+            for script in soup.select('script[type="application/ld+json"]'):
+                try:
+                    data = json.loads(script.string or '')
+                except ValueError:
+                    continue
+                for item in data if isinstance(data, list) else [data]:
+                    offers = item.get('offers') if isinstance(item, dict) else None
+                    if isinstance(offers, dict):
+                        offers = [offers]
+                    for offer in offers or []:
+                        availability = offer.get('availability', '')
+                        status = 'Out of Stock' if 'OutOfStock' in availability or 'SoldOut' in availability else 'In Stock'
+                        variant_id = re.search(r'variant=(\d+)', offer.get('url', ''))
+                        if variant_id:
+                            variants[variant_id.group(1)] = status
+                        if offer.get('sku'):
+                            variants[offer['sku']] = status
 
-                return available
+            return {'available': available, 'variants': variants}
 
+        def fetch_stock_page(product_url):
+            # The product page is fetched and parsed once per run, however many
+            # sold out variants need the fallback.
+            with stock_pages_lock:
+                if product_url in stock_pages:
+                    return stock_pages[product_url]
+            try:
+                response = http_client.get(product_url)
+                response.raise_for_status() 
+                page = http_client.parsed(response, 'morfars-stock', parse_stock_page)
             except requests.RequestException as e:
                 print(f"Error fetching data from {product_url}: {e}")
+                page = None
+            with stock_pages_lock:
+                stock_pages[product_url] = page
+            return page
+
+        def fetch_stock_status(product_url, variant):
+            page = fetch_stock_page(product_url)
+            if page is None:
                 return 'N/A'
+            variant_status = page['variants'].get(str(variant.get('id'))) or page['variants'].get(variant.get('sku'))
+            return variant_status or page['available']
             
         def extract_details(product_url):
+            lastmod = lastmods.get(product_url, '')
+            if delta:
+                carried = delta.carry(product_url, lastmod=lastmod)
+                if carried is not None:
+                    return carried
+
             json_url = product_url + ".json"
-            response = requests.get(json_url)
+            response = http_client.get(json_url)
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()  # Retried by the fetch engine
             if response.status_code == 200:
-                product_data = response.json()['product']
+                product_data = http_client.parsed(response, None, lambda r: r.json()['product'])
                 variants = product_data['variants']
 
+                # Unchanged product and stock counts: skip the stock page fallback
+                marker = fingerprint(product_data.get('updated_at'), [
+                    (variant.get('id'), variant.get('updated_at'), variant.get('price'),
+                     variant.get('inventory_quantity'), variant.get('inventory_management'))
+                    for variant in variants])
+                if delta:
+                    carried = delta.carry(product_url, fingerprint=marker)
+                    if carried is not None:
+                        delta.record(product_url, carried, lastmod=lastmod, fingerprint=marker)
+                        return carried
+
                 details = []
                 for variant in variants:
                     title = product_data.get('title', 'N/A')
@@ -130,24 +218,28 @@ class MorfarsScraper:
                     quantity = variant.get('inventory_quantity', 'N/A')
                     
                     if quantity == 'N/A' or int(quantity) <= 0:
-                        available = fetch_stock_status(product_url)
+                        available = fetch_stock_status(product_url, variant)
                         # print(f"Product availability: {available}")
                         
                     details.append({
                         'Title': title,
                         'Brand': brand,
+                        'Variants': variant.get('title', 'N/A'),
                         'SKU': sku,
                         'Price': f'{price} kr' if price != 'N/A' else 'N/A',
                         'Stock Status': available,
                         'Quantity': quantity,
                         'URL': product_url
                     })
+                if delta:
+                    delta.record(product_url, details, lastmod=lastmod, fingerprint=marker)
                 return details
             else:
                 logging.error(f"Failed to fetch data from {json_url}")
                 return [{
                     'Title': 'N/A',
                     'Brand': 'N/A',
+                    'Variants': 'N/A',
                     'SKU': 'N/A',
                     'Price': 'N/A',
                     'Stock Status': 'N/A',
@@ -155,32 +247,89 @@ class MorfarsScraper:
                     'URL': product_url
                 }]
 
-        with open(product_urls_file, "r") as file:
-            reader = csv.DictReader(file)
-            product_urls = [row['Product Link'] for row in reader]
+        if product_urls is None:
+            with open(product_urls_file, "r") as file:
+                reader = csv.DictReader(file)
+                product_urls = [row['Product Link'] for row in reader]
 
-        with open(output_file, "w", newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Title', 'Brand', 'SKU', 'Price', 'Stock Status', 'Quantity', 'URL']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
+        # Resumes an interrupted crawl into the same output file
+        state = CrawlState(output_file)
+        with CrawlOutput(self.SITE, state, delta) as crawl:
+            with open(output_file, "a" if crawl.resumed else "w", newline='', encoding='utf-8') as csvfile:
+                fieldnames = ['Title', 'Brand', 'Variants', 'SKU', 'Price', 'Stock Status', 'Quantity', 'URL']
+                writer = crawl.writer(csv.DictWriter(csvfile, fieldnames=fieldnames))
+                if csvfile.tell() == 0:
+                    writer.writeheader()
+                crawl.track(csvfile)
 
-            for url in product_urls:
-                try:
-                    product_details_list = extract_details(url)
+                engine = FetchEngine(per_host_limit=per_host_limit)
+                for url, product_details_list, error in engine.map(extract_details, state.remaining(product_urls)):
+                    if error:
+                        logging.info(f"error while processing url: {url} \n error:{error}")
+                        writer.keep(url)
+                        state.mark(url, FAILED)
+                        continue
                     for product_details in product_details_list:
                         writer.writerow(product_details)
-                except:
-                    try:
-                        time.sleep(30)
-                        product_details_list = extract_details(url)
-                        for product_details in product_details_list:
-                            writer.writerow(product_details)
-                    except Exception as a:
-                        logging.info(f"error while processing url: {url} \n error:{a}")
-            logging.info(f"Product details extracted and saved to {output_file}")
+                    state.mark(url, DONE)
+        logging.info(f"Product details extracted and saved to {output_file}")
+
+    def extract_catalog(self, url, output_file, page_size=250):
+        # Bulk mode: Shopify serves the whole catalog, variants included, from
+        # the paginated products.json of a collection. A few dozen requests
+        # replace the browser crawl plus one .json request per product.
+        parts = urlsplit(url)
+        store_url = f"{parts.scheme}://{parts.netloc}"
+        retry_policy = RetryPolicy()
+
+        def fetch_page(page_url):
+            response = http_client.get(page_url)
+            response.raise_for_status()
+            return http_client.parsed(response, None, lambda r: r.json()['products'])
+
+        # A page that cannot be read leaves the catalog partial: the sinks are
+        # then closed, not finished
+        with CrawlOutput(self.SITE) as crawl:
+            with open(output_file, "w", newline='', encoding='utf-8') as csvfile:
+                fieldnames = ['Title', 'Brand', 'Variants', 'SKU', 'Price', 'Stock Status', 'Quantity', 'URL']
+                writer = crawl.writer(csv.DictWriter(csvfile, fieldnames=fieldnames))
+                writer.writeheader()
+
+                page = 1
+                total = 0
+                while True:
+                    page_url = f"{url.rstrip('/')}/products.json?limit={page_size}&page={page}"
+                    products = retry_policy.call(fetch_page, page_url)
+                    if not products:
+                        break
+
+                    for product_data in products:
+                        product_url = f"{store_url}/products/{product_data['handle']}"
+                        for variant in product_data.get('variants', []):
+                            price = variant.get('price', 'N/A')
+                            writer.writerow({
+                                'Title': product_data.get('title', 'N/A'),
+                                'Brand': product_data.get('vendor', 'N/A'),
+                                'Variants': variant.get('title', 'N/A'),
+                                'SKU': variant.get('sku', 'N/A'),
+                                'Price': f'{price} kr' if price != 'N/A' else 'N/A',
+                                'Stock Status': 'In Stock' if variant.get('available') else 'Out of Stock',
+                                'Quantity': variant.get('inventory_quantity', 'N/A'),
+                                'URL': product_url
+                            })
+                    total += len(products)
+                    logging.info(f"Extracted {len(products)} products from catalog page {page}")
+                    page += 1
+
+        logging.info(f"Catalog of {total} products extracted and saved to {output_file}")
 
     def close_driver(self):
-        self.driver.quit()
+        chrome_driver.log_stats()
+        wait_strategy.log_stats()
+        if self._driver is None:
+            return
+        self._driver.quit()
+        self._driver = None
         logging.info("WebDriver closed")
 
 if __name__ == "__main__":
@@ -193,7 +342,8 @@ if __name__ == "__main__":
     print("Choose an option:")
     print("1. Extract product links from collection links")
     print("2. Extract product details from product links")
-    option = input("Enter the option number (1, 2): ")
+    print("3. Extract product details from the Shopify catalog (bulk)")
+    option = input("Enter the option number (1, 2, 3): ")
 
     if option == "1":
         scraper.extract_product_links(url, product_urls)
@@ -201,7 +351,9 @@ if __name__ == "__main__":
     elif option == "2":
         scraper.close_driver()
         scraper.extract_product_details(product_urls, product_details)
-        
+    elif option == "3":
+        scraper.close_driver()
+        scraper.extract_catalog(url, product_details)
     else:
         print("Invalid option. Please run the script again and choose a valid option.")
         scraper.close_driver()
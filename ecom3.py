@@ -1,16 +1,18 @@
 import csv
-import json
 import logging
-from bs4 import BeautifulSoup
-import requests
-from selenium import webdriver
+import http_client
+import sitemap
+import pipeline
+import frontier
+from fetch_engine import FetchEngine
+from crawl_state import CrawlState, DONE, FAILED
+from crawl_output import CrawlOutput
+from delta import DeltaIndex
+import product_json
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-import time
+import chrome_driver
+import wait_strategy
 
 # Configure logging
 logging.basicConfig(
@@ -20,7 +22,22 @@ logging.basicConfig(
 )
 
 class SpeedHobby_Scraper:
+    # Key of the site in the change feed and the store
+    SITE = 'speedhobby'
+    # A listing page is ready once its product cards are rendered
+    LISTING_READY = wait_strategy.Ready('.product-index .prod-image a', timeout=10)
+
     def __init__(self):
+        self._driver = None
+
+    @property
+    def driver(self):
+        # Chrome is only started once a stage actually needs the browser
+        if self._driver is None:
+            self._driver = self.new_driver()
+        return self._driver
+
+    def new_driver(self):
         options = Options()
         # ****************** Use this for server hosting ***********************
         options.add_argument("--headless") 
@@ -29,25 +46,22 @@ class SpeedHobby_Scraper:
         options.add_argument("--disable-dev-shm-usage")
         # **********************************************************************
         
-        self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+        driver = chrome_driver.start(options)
         logging.info("Initialized WebDriver")
-
-    def extract_product_links(self, url, output_file):
-        def extract_links_from_page(url):
-            self.driver.get(url)
-            time.sleep(5)
-            product_elements = self.driver.find_elements(By.CSS_SELECTOR, '.product-index .prod-image a')
-            product_links = [element.get_attribute('href') for element in product_elements if element.get_attribute('href')]
-
-            with open(output_file, "a", newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=['Product Link'])
-                if csvfile.tell() == 0:
-                    writer.writeheader()
-                for link in product_links:
-                    writer.writerow({'Product Link': link})
-
-            logging.info(f"Extracted {len(product_links)} product links from {url}")
-            return product_links
+        return driver
+
+    def iter_product_links(self, url):
+        # Yields (product_url, lastmod) as links are found: from the Shopify
+        # sitemaps, else by paging through the collection in the browser.
+        count = 0
+        for link, lastmod in sitemap.discover(url, sitemap_filter=lambda u: 'sitemap_products' in u,
+                                              url_filter=lambda u: '/products/' in u):
+            count += 1
+            yield link, lastmod
+        if count:
+            logging.info(f"Extracted {count} product links from the sitemap of {url}")
+            return
+        logging.info(f"No product sitemap found for {url}, falling back to browser pagination")
 
         def get_next_page_url():
             try:
@@ -56,76 +70,39 @@ class SpeedHobby_Scraper:
             except:
                 return None
 
-        def extract_all_product_links(start_url):
-            all_links = []
-            self.driver.get(start_url)
-            while True:
-                product_links = extract_links_from_page(self.driver.current_url)
-                all_links.extend(product_links)
-                next_page_url = get_next_page_url()
-                if next_page_url:
-                    self.driver.get(next_page_url)
-                    time.sleep(5)
-                else:
-                    break
-            logging.info(f"Total product links extracted: {len(all_links)}")
-            return all_links
-
-        extract_all_product_links(url)
-
-    def extract_product_details(self,product_urls_file, output_file):
-        def extract_details(product_url):
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-
-            for attempt in range(2):  
-                try:
-                    response = requests.get(product_url, headers=headers)
-                    response.raise_for_status() 
-
-                    soup = BeautifulSoup(response.content, 'html.parser')
-
-                    # Extract JSON data embedded in a <script> tag
-                    script_element = soup.find('script', {'class': 'product-json'})
-                    if script_element:
-                        product_json = script_element.string
-                        product_data = json.loads(product_json)
-
-                        details = []
-                        for variant in product_data['variants']:
-                            formatted_price = "{:,.2f}".format(float(variant['price']) / 100)
-                            details.append({
-                                'Title': product_data['title'],
-                                'Brand': product_data['vendor'],
-                                'Variants': variant['title'],
-                                'SKU': variant['sku'],
-                                'Price': f"Rs. {formatted_price}",
-                                'Stock Status': 'In Stock' if variant['available'] else 'Out of Stock',
-                                'Quantity': variant['inventory_quantity'],
-                                'URL': product_url
-                            })
-                        return details
-                    else:
-                        logging.error(f'No product JSON found at {product_url}')
-                        return [{
-                            'Title': 'N/A',
-                            'Brand': 'N/A',
-                            'Variants': 'N/A',
-                            'SKU': 'N/A',
-                            'Price': 'N/A',
-                            'Stock Status': 'N/A',
-                            'Quantity': 'N/A',
-                            'URL': product_url
-                        }]
-
-                except Exception as e:
-                    logging.error(f'Error extracting details from {product_url} on attempt {attempt+1}: {e}')
-                    if attempt == 0:  # Wait before retrying only after the first attempt
-                        time.sleep(20)
-
-            # If all attempts fail
-            logging.error(f'Failed to extract details from {product_url} after multiple attempts.')
+        # Each page is loaded once; the next link is read from the loaded page
+        page_url = url
+        while page_url:
+            wait_strategy.load(self.driver, page_url, self.LISTING_READY, 'listing')
+            product_elements = self.driver.find_elements(By.CSS_SELECTOR, '.product-index .prod-image a')
+            product_links = [element.get_attribute('href') for element in product_elements if element.get_attribute('href')]
+            logging.info(f"Extracted {len(product_links)} product links from {page_url}")
+            for link in product_links:
+                yield link, ''
+            page_url = get_next_page_url()
+
+    def extract_product_links(self, url, output_file):
+        count = pipeline.save_links(frontier.unique_links(self.iter_product_links(url)), output_file)
+        logging.info(f"Total product links extracted: {count}")
+
+    def run_pipeline(self, url, output_file, product_urls_file=None, per_host_limit=8, incremental=False):
+        # Streaming mode: details are extracted while links are still being
+        # discovered; product_urls_file, if given, is kept as a checkpoint.
+        lastmods = {}
+        links = frontier.unique_links(self.iter_product_links(url))
+        product_urls = pipeline.stream(links, checkpoint=product_urls_file, lastmods=lastmods)
+        self.extract_product_details(product_urls_file, output_file, per_host_limit, product_urls=product_urls,
+                                     incremental=incremental, lastmods=lastmods)
+
+    def extract_product_details(self, product_urls_file, output_file, per_host_limit=8, product_urls=None,
+                                incremental=False, lastmods=None):
+        # Incremental mode re-extracts only products whose sitemap lastmod
+        # changed since the last run into output_file.
+        delta = DeltaIndex(output_file) if incremental else None
+        if lastmods is None:
+            lastmods = pipeline.read_lastmods(product_urls_file) if incremental and product_urls_file else {}
+
+        def empty_details(product_url):
             return [{
                 'Title': 'N/A',
                 'Brand': 'N/A',
@@ -137,23 +114,76 @@ class SpeedHobby_Scraper:
                 'URL': product_url
             }]
 
-        with open(product_urls_file, "r") as file:
-            reader = csv.DictReader(file)
-            product_urls = [row['Product Link'] for row in reader]
-
-        with open(output_file, "w", newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Title', 'Brand', 'Variants', 'SKU', 'Price', 'Stock Status', 'Quantity', 'URL']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-
-            for url in product_urls:
-                product_details_list = extract_details(url)
-                for product_details in product_details_list:
-                    writer.writerow(product_details)
-            
-            logging.info(f"Product details extracted and saved to {output_file}")
+        def parse_product_json(response):
+            # Extract JSON data embedded in a <script> tag
+            product_data, path = product_json.extract(response.content, script_class='product-json')
+            return product_data
+
+        def extract_details(product_url):
+            lastmod = lastmods.get(product_url, '')
+            if delta:
+                carried = delta.carry(product_url, lastmod=lastmod)
+                if carried is not None:
+                    return carried
+
+            response = http_client.get(product_url)
+            response.raise_for_status() 
+
+            product_data = http_client.parsed(response, 'product-json', parse_product_json)
+            if product_data:
+                details = []
+                for variant in product_data['variants']:
+                    formatted_price = "{:,.2f}".format(float(variant['price']) / 100)
+                    details.append({
+                        'Title': product_data['title'],
+                        'Brand': product_data['vendor'],
+                        'Variants': variant['title'],
+                        'SKU': variant['sku'],
+                        'Price': f"Rs. {formatted_price}",
+                        'Stock Status': 'In Stock' if variant['available'] else 'Out of Stock',
+                        'Quantity': variant['inventory_quantity'],
+                        'URL': product_url
+                    })
+                if delta:
+                    delta.record(product_url, details, lastmod=lastmod)
+                return details
+            else:
+                logging.error(f'No product JSON found at {product_url}')
+                return empty_details(product_url)
+
+        if product_urls is None:
+            with open(product_urls_file, "r") as file:
+                reader = csv.DictReader(file)
+                product_urls = [row['Product Link'] for row in reader]
+
+        # Resumes an interrupted crawl into the same output file
+        state = CrawlState(output_file)
+        with CrawlOutput(self.SITE, state, delta) as crawl:
+            with open(output_file, "a" if crawl.resumed else "w", newline='', encoding='utf-8') as csvfile:
+                fieldnames = ['Title', 'Brand', 'Variants', 'SKU', 'Price', 'Stock Status', 'Quantity', 'URL']
+                writer = crawl.writer(csv.DictWriter(csvfile, fieldnames=fieldnames))
+                if csvfile.tell() == 0:
+                    writer.writeheader()
+                crawl.track(csvfile)
+
+                engine = FetchEngine(per_host_limit=per_host_limit)
+                for url, product_details_list, error in engine.map(extract_details, state.remaining(product_urls)):
+                    if error:
+                        logging.error(f'Failed to extract details from {url} after multiple attempts: {error}')
+                        writer.keep(url)
+                        product_details_list = empty_details(url)
+                    for product_details in product_details_list:
+                        writer.writerow(product_details)
+                    state.mark(url, FAILED if error else DONE)
+        logging.info(f"Product details extracted and saved to {output_file}")
+        product_json.log_stats()
     def close_driver(self):
-        self.driver.quit()
+        chrome_driver.log_stats()
+        wait_strategy.log_stats()
+        if self._driver is None:
+            return
+        self._driver.quit()
+        self._driver = None
         logging.info("WebDriver closed")
 
 if __name__ == "__main__":
@@ -1,13 +1,19 @@
 import csv
 import logging
-from selenium import webdriver
+from urllib.parse import urljoin
+import http_client
+import html_parser
+import frontier
+from fetch_engine import FetchEngine
+from retry import RetryPolicy
+from browser_pool import BrowserPool, DEFAULT_SIZE
+from crawl_output import CrawlOutput
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-import time
+import chrome_driver
+import wait_strategy
 
 # Configure logging for HobbyKarlScraper
 logging.basicConfig(
@@ -17,7 +23,51 @@ logging.basicConfig(
 )
 
 class HobbyKarlScraper:
+    # Key of the site in the change feed and the store
+    SITE = 'hobbykarl'
+    # Only the product cards and the pagination are built for listing pages
+    LISTING_PARTS = html_parser.ParseOnly(classes=['productItem', 'pagination'])
+    # Browser waits: the category sitemap and a rendered product listing
+    COLLECTIONS_READY = wait_strategy.Ready('ul.m-sitemap-cat.m-links.list-unstyled a')
+    LISTING_READY = wait_strategy.Ready('.productItem', timeout=10)
+
+    # Same fields and fallbacks as the static listing parser, evaluated in the
+    # browser. Like WebElement.text, hidden elements read as an empty string.
+    LISTING_SCRIPT = """
+        const text = (item, selector) => {
+            const element = item.querySelector(selector);
+            if (!element) return null;
+            return element.getClientRects().length ? element.innerText.trim() : '';
+        };
+        return Array.from(document.querySelectorAll('.productItem')).map(item => {
+            let stock = text(item, '.product-delivery .stockAmount');
+            if (stock === null) stock = text(item, '.badge-danger.m-productlist-soldout');
+            if (stock === null) stock = text(item, '.product-delivery p');
+            if (stock === null) stock = 'In stock';
+            const link = item.querySelector('.productItem a');
+            return {
+                'Product Name': text(item, '.m-productlist-title') ?? 'N/A',
+                'Brand': text(item, '.m-productlist-brand') ?? 'N/A',
+                'SKU': text(item, '.m-productlist-itemNumber') ?? 'N/A',
+                'Price': text(item, '.m-productlist-price') ?? 'N/A',
+                'Stock Status': stock,
+                'URL': link && link.href ? link.href : 'N/A'
+            };
+        });
+    """
+
     def __init__(self):
+        self.retry_policy = RetryPolicy()
+        self._driver = None
+
+    @property
+    def driver(self):
+        # Chrome is only started once a stage actually needs the browser
+        if self._driver is None:
+            self._driver = self.new_driver()
+        return self._driver
+
+    def new_driver(self):
         options = Options()
         # ****************** Use this for server hosting ***********************
         options.add_argument("--headless") 
@@ -26,22 +76,21 @@ class HobbyKarlScraper:
         options.add_argument("--disable-dev-shm-usage")
         # **********************************************************************
         
-        self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-        self.driver.set_window_size(1920, 1080)
+        driver = chrome_driver.start(options)
+        driver.set_window_size(1920, 1080)
+        return driver
     
     def extract_collection_links(self, output_file, url):
         all_links = []
-        self.driver.get(url)
-        time.sleep(2)  
-
-        wait = WebDriverWait(self.driver, 10)
-        sitemap = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "ul.m-sitemap-cat.m-links.list-unstyled")))
+        seen = frontier.Frontier()  # The same collection is often linked twice
+        wait_strategy.load(self.driver, url, self.COLLECTIONS_READY, 'collections')
+        sitemap = self.driver.find_element(By.CSS_SELECTOR, "ul.m-sitemap-cat.m-links.list-unstyled")
 
         collection_links = sitemap.find_elements(By.TAG_NAME, "a")
 
         for link in collection_links:
             href = link.get_attribute("href")
-            if href:
+            if href and seen.add(frontier.canonical(href)):
                 all_links.append(href)
 
         with open(output_file, 'w', newline='') as file:
@@ -52,112 +101,164 @@ class HobbyKarlScraper:
         
         logging.info(f"Extracted {len(all_links)} collection links.")
 
-    def extract_product_details(self, collection_file, output_file):
-        def extract_details_from_page(url):
-            self.driver.get(url)
-            time.sleep(5)
-            
-            product_details = []
-            while True:
-                products = self.driver.find_elements(By.CSS_SELECTOR, '.productItem')
-                for product in products:
-                    try:
-                        try:
-                            name_element = product.find_element(By.CSS_SELECTOR, '.m-productlist-title')
-                            product_name = name_element.text
-                        except:
-                            product_name = "N/A"
-                        
-                        try:
-                            brand_element = product.find_element(By.CSS_SELECTOR, '.m-productlist-brand')
-                            product_brand = brand_element.text
-                        except:
-                            product_brand = "N/A"
-                        
-                        try:
-                            sku_element = product.find_element(By.CSS_SELECTOR, '.m-productlist-itemNumber')
-                            product_sku = sku_element.text
-                        except:
-                            product_sku = "N/A"
-                        
-                        try:
-                            price_element = product.find_element(By.CSS_SELECTOR, '.m-productlist-price')
-                            product_price = price_element.text
-                        except:
-                            product_price = "N/A"
-                        
-                        try:
-                            stock_status_element = product.find_element(By.CSS_SELECTOR, '.product-delivery .stockAmount')
-                            stock_status = stock_status_element.text
-                        except:
-                            try:
-                                sold_out_badge = product.find_element(By.CSS_SELECTOR, '.badge-danger.m-productlist-soldout')
-                                stock_status = sold_out_badge.text
-                            except:
-                                try:
-                                    stock_status_text = product.find_element(By.CSS_SELECTOR, '.product-delivery p')
-                                    stock_status = stock_status_text.text
-                                except:
-                                    stock_status = "In stock"
-                        
-                        try:
-                            link_element = product.find_element(By.CSS_SELECTOR, '.productItem a')
-                            product_link = link_element.get_attribute('href')
-                        except:
-                            product_link = "N/A"
-                        
-                        product_details.append({
-                            'Product Name': product_name,
-                            'Brand': product_brand,
-                            'SKU': product_sku,
-                            'Price': product_price,
-                            'Stock Status': stock_status,
-                            'URL': product_link
-                        })
-                        
-                    except Exception as e:
-                        logging.error(f"Error extracting product details: {e}")
-                
-                try:
-                    next_button = WebDriverWait(self.driver, 10).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, '.pagination li:last-child a'))
-                    )
-                    
-                    next_button_class = next_button.find_element(By.XPATH, '..').get_attribute('class')
-
-                    if 'is-disabled' in next_button_class:
-                        break  
-
-                    self.driver.execute_script("arguments[0].scrollIntoView(true);", next_button)
-                    time.sleep(2) 
-
-                    next_button.click()
-                    time.sleep(5)  
-
-                except Exception as e:
-                    logging.error(f"Pagination button not found or error: {e}")
+    def read_listing_page(self, soup):
+        # Static version of the browser extraction below. Returns the products
+        # on the page, the next page link and whether the listing looked
+        # complete without JavaScript.
+        def text(element, selector):
+            found = element.select_one(selector)
+            return ' '.join(found.get_text(' ').split()) if found is not None else None
+
+        products = []
+        complete = True
+        for product in soup.select('.productItem'):
+            stock_status = "In stock"
+            for selector in ('.product-delivery .stockAmount', '.badge-danger.m-productlist-soldout', '.product-delivery p'):
+                if product.select_one(selector) is not None:
+                    stock_status = text(product, selector)
+                    break
+            link = product.select_one('a[href]')
+            product_name = text(product, '.m-productlist-title')
+            if not link or product_name is None:
+                complete = False
+            products.append({
+                'Product Name': product_name or "N/A",
+                'Brand': text(product, '.m-productlist-brand') or "N/A",
+                'SKU': text(product, '.m-productlist-itemNumber') or "N/A",
+                'Price': text(product, '.m-productlist-price') or "N/A",
+                'Stock Status': stock_status,
+                'URL': link['href'] if link else "N/A"
+            })
+        if not products:
+            complete = False
+
+        next_page = None
+        next_button = soup.select_one('.pagination li:last-child a')
+        if next_button and 'is-disabled' not in (next_button.parent.get('class') or ''):
+            next_page = next_button.get('href')
+            if not next_page or next_page.startswith(('#', 'javascript')):
+                complete = False  # Pagination only works through JavaScript
+        return {'products': products, 'next_page': next_page, 'complete': complete}
+
+    def crawl_collection(self, url):
+        # Walks a collection's pages over HTTP. Returns None when the static
+        # listing is incomplete, so the collection goes to the browser instead.
+        product_details = []
+        page_url = url
+        seen_pages = set()
+        while page_url and page_url not in seen_pages:
+            seen_pages.add(page_url)
+            try:
+                response = self.retry_policy.call(self.fetch_page, page_url)
+            except Exception as e:
+                logging.error(f"Error fetching collection page {page_url}: {e}")
+                return None
+            page = html_parser.extract(response.content, self.read_listing_page, only=self.LISTING_PARTS)
+            if not page['complete']:
+                logging.info(f"Static listing incomplete for {page_url}")
+                return None
+            for details in page['products']:
+                details['URL'] = urljoin(page_url, details['URL'])
+                product_details.append(details)
+            page_url = urljoin(page_url, page['next_page']) if page['next_page'] else None
+
+        logging.info(f"Extracted {len(product_details)} products over HTTP from {url}")
+        return product_details
+
+    def fetch_page(self, url):
+        response = http_client.get(url)
+        response.raise_for_status()
+        return response
+
+    def extract_details_from_browser(self, url, driver=None):
+        driver = driver or self.driver
+        wait_strategy.load(driver, url, self.LISTING_READY, 'listing')
+
+        product_details = []
+        while True:
+            # One script call collects every product on the page instead of
+            # a WebDriver round trip per field and fallback.
+            try:
+                product_details.extend(driver.execute_script(self.LISTING_SCRIPT))
+            except Exception as e:
+                logging.error(f"Error extracting product details: {e}")
+
+            try:
+                next_button = WebDriverWait(driver, 10).until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, '.pagination li:last-child a'))
+                )
+
+                next_button_class = next_button.find_element(By.XPATH, '..').get_attribute('class')
+
+                if 'is-disabled' in next_button_class:
                     break  
-            
-            return product_details
 
+                driver.execute_script("arguments[0].scrollIntoView(true);", next_button)
+                first_product = driver.find_element(By.CSS_SELECTOR, '.productItem')
+                next_button.click()
+                wait_strategy.wait_for_replacement(driver, first_product, self.LISTING_READY, 'listing')
+
+            except Exception as e:
+                logging.error(f"Pagination button not found or error: {e}")
+                break  
+
+        return product_details
+
+    def extract_product_details(self, collection_file, output_file, use_http=True, per_host_limit=4, browsers=DEFAULT_SIZE):
         with open(collection_file, "r") as file:
             reader = csv.DictReader(file)
             collection_urls = [row['Collection Link'] for row in reader]
 
-        with open(output_file, "w", newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Product Name', 'Brand', 'SKU', 'Price', 'Stock Status', 'URL']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
+        failed = 0
+        products = frontier.Frontier()
+        with CrawlOutput(self.SITE) as crawl:
+            with open(output_file, "w", newline='', encoding='utf-8') as csvfile:
+                fieldnames = ['Product Name', 'Brand', 'SKU', 'Price', 'Stock Status', 'URL']
+                writer = crawl.writer(csv.DictWriter(csvfile, fieldnames=fieldnames))
+                writer.writeheader()
+
+                def write_products(product_details):
+                    # A product listed in several collections is written once
+                    for details in product_details:
+                        if details['URL'] != 'N/A':
+                            details['URL'] = frontier.canonical(details['URL'])
+                            if not products.add(details['URL']):
+                                continue
+                        writer.writerow(details)
             
-            for url in collection_urls:
-                product_details = extract_details_from_page(url)
-                for details in product_details:
-                    writer.writerow(details)
+                browser_urls = collection_urls
+                if use_http:
+                    # Collections are fetched concurrently over HTTP; only the
+                    # ones whose static listing is incomplete need the browser.
+                    browser_urls = []
+                    engine = FetchEngine(per_host_limit=per_host_limit)
+                    for url, product_details, error in engine.map(self.crawl_collection, collection_urls):
+                        if error or product_details is None:
+                            browser_urls.append(url)
+                            continue
+                        write_products(product_details)
+                    logging.info(f"{len(browser_urls)} of {len(collection_urls)} collections need the browser.")
+
+                pool = BrowserPool(self.new_driver, size=browsers)
+                for url, product_details, error in pool.map(lambda driver, url: self.extract_details_from_browser(url, driver), browser_urls):
+                    if error:
+                        logging.error(f"Error extracting {url} in the browser: {error}")
+                        failed += 1
+                        continue
+                    write_products(product_details)
+            # Products of a collection that failed are not known to be gone
+            crawl.partial = failed
         
-        logging.info(f"Extracted product details for {len(collection_urls)} collection pages.")
+        logging.info(f"Extracted product details for {len(collection_urls)} collection pages, "
+                     f"{products.duplicates} duplicate products skipped.")
 
     def close_driver(self):
-        self.driver.quit()
+        chrome_driver.log_stats()
+        wait_strategy.log_stats()
+        if self._driver is None:
+            return
+        self._driver.quit()
+        self._driver = None
 
 if __name__ == "__main__":
     scraper = HobbyKarlScraper()
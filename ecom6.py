@@ -3,16 +3,26 @@ import gc
 import json
 import logging
 import os
-from selenium import webdriver
+import re
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-import time
+import chrome_driver
+import wait_strategy
 import requests
-from bs4 import BeautifulSoup
+import http_client
+import sitemap
+import pipeline
+import frontier
+from fetch_engine import FetchEngine
+from crawl_state import CrawlState, DONE, FAILED, VARIANT
+from delta import DeltaIndex
+from crawl_output import CrawlOutput
+from output import RowWriter
+import html_parser
+import variant_resolver
+from variant_resolver import VariantResolver
+from browser_pool import BrowserPool, DEFAULT_SIZE
 
 # Configure logging for ModelSportScraper
 logging.basicConfig(
@@ -22,11 +32,31 @@ logging.basicConfig(
 )
 
 class ModelSportScraper:
+    # Only the subtrees parse_product_page queries are built
+    PRODUCT_PAGE_PARTS = html_parser.ParseOnly(
+        classes=['m-product-buttons-list-button', 'm-product-title', 'm-product-brand',
+                 'm-product-itemNumber-value', 'm-product-stock-text'],
+        attrs={'itemprop': 'price'})
+    # Key of the site in the change feed and the store, and the output columns
+    SITE = 'modelsport'
+    OUTPUT_FIELDS = ['Title', 'Brand', 'SKU', 'Price', 'Stock Status', 'URL']
+    SITE_URL = 'https://modelsport.dk/'
+    # Product pages in the XML sitemap: /shop/<category>/<id>-<slug>/
+    PRODUCT_URL_PATTERN = re.compile(r'/shop/.+/\d+-[^/]+/?$')
+    # Browser waits: any page body (before cookies are set), the collection
+    # menu, a page of the product sitemap and a product page
+    HOME_READY = wait_strategy.Ready('body')
+    COLLECTIONS_READY = wait_strategy.Ready('ul.menu.productmenu.menu-inline a')
+    SITEMAP_READY = wait_strategy.Ready('.m-sitemap-prod.m-links.list-unstyled li.m-sitemap-prod-item')
+    PRODUCT_READY = wait_strategy.Ready('#zoomHook')
+
     def __init__(self):
         self.driver=None
+        self.delta = None
+        self.lastmods = {}
         
     
-    def chrome(self):
+    def new_driver(self):
         options = Options()
         # ****************** Use this for server hosting ***********************
         options.add_argument("--headless") 
@@ -48,14 +78,22 @@ class ModelSportScraper:
         # options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36")
         # **********************************************************************
         
-        self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-        self.driver.set_window_size(1920, 1080)
-        
-        self.driver.get("https://modelsport.dk/")
-        time.sleep(4)
+        driver = chrome_driver.start(options)
+        driver.set_window_size(1920, 1080)
+        return driver
+
+    def warm_up(self, driver):
+        driver.get("https://modelsport.dk/")
+        wait_strategy.wait(driver, self.HOME_READY, 'home')
         # self.save_cookies("modelsport_cookies.json") # use when needed to refresh cookies or when cookies file missing
-        self.load_cookies("modelsport_cookies.json")
-        self.driver.refresh()
+        self.load_cookies("modelsport_cookies.json", driver)
+        driver.refresh()
+
+    def chrome(self):
+        if self.driver is not None:
+            return
+        self.driver = self.new_driver()
+        self.warm_up(self.driver)
         logging.info("Initialized ModelSportScraper and loaded cookies.")
         
     def save_cookies(self, path):
@@ -63,12 +101,13 @@ class ModelSportScraper:
             json.dump(self.driver.get_cookies(), file)
         logging.info(f"Cookies saved to {path}.")
 
-    def load_cookies(self, path):
+    def load_cookies(self, path, driver=None):
+        driver = driver or self.driver
         try:
             with open(path, 'r') as file:
                 cookies = json.load(file)
                 for cookie in cookies:
-                    self.driver.add_cookie(cookie)
+                    driver.add_cookie(cookie)
             logging.info(f"Cookies loaded from {path}.")
         except FileNotFoundError:
             logging.error(f"Cookies file {path} not found.")
@@ -77,17 +116,16 @@ class ModelSportScraper:
 
     def extract_collection_links(self, output_file, url):
         all_links = []
-        self.driver.get(url)
-        time.sleep(2)
-
-        wait = WebDriverWait(self.driver, 10)
-        menu = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "ul.menu.productmenu.menu-inline")))
+        seen = frontier.Frontier()  # The same collection is often linked twice
+        self.chrome()
+        wait_strategy.load(self.driver, url, self.COLLECTIONS_READY, 'collections')
+        menu = self.driver.find_element(By.CSS_SELECTOR, "ul.menu.productmenu.menu-inline")
 
         collection_links = menu.find_elements(By.TAG_NAME, "a")
         
         for link in collection_links:
             href = link.get_attribute("href")
-            if href and "shop" in href:
+            if href and "shop" in href and seen.add(frontier.canonical(href)):
                 all_links.append(href)
 
         with open(output_file, 'w', newline='') as file:
@@ -97,12 +135,22 @@ class ModelSportScraper:
         
         logging.info(f"Extracted {len(all_links)} collection links.")
 
-    def get_product_links(self, output_file):
+    def iter_product_links(self):
+        # Yields (product_url, lastmod) as links are found: from the XML
+        # sitemaps, else by paging through the HTML sitemap in the browser.
+        count = 0
+        for link, lastmod in sitemap.discover(self.SITE_URL, url_filter=lambda u: self.PRODUCT_URL_PATTERN.search(u)):
+            count += 1
+            yield link, lastmod
+        if count:
+            logging.info(f"Total of {count} product links extracted from the XML sitemap.")
+            return
+        logging.info("No product sitemap found, falling back to the browser sitemap crawl")
+
         self.chrome()
-        product_links = []
+        count = 0
         sitemap_url = "https://modelsport.dk/sitemap/produkter/"
-        self.driver.get(sitemap_url)
-        time.sleep(3)  
+        wait_strategy.load(self.driver, sitemap_url, self.SITEMAP_READY, 'sitemap page')
         page_count = 1
 
         while True:
@@ -114,7 +162,9 @@ class ModelSportScraper:
                 product_items = product_list.find_elements(By.CSS_SELECTOR, 'li.m-sitemap-prod-item.m-links-prod a')
                 
                 page_links = [item.get_attribute('href') for item in product_items]
-                product_links.extend(page_links)
+                for link in page_links:
+                    yield link, ''
+                count += len(page_links)
 
                 logging.info(f"Extracted {len(page_links)} product links from page {page_count}.")
                
@@ -122,7 +172,7 @@ class ModelSportScraper:
                     next_button = self.driver.find_element(By.CSS_SELECTOR, '.w-pagination-list a[rel="next"]')
                     if next_button:
                         next_button.click()
-                        time.sleep(3)  
+                        wait_strategy.wait_for_replacement(self.driver, product_items[0], self.SITEMAP_READY, 'sitemap page')
                         page_count += 1
                     else:
                         break 
@@ -134,91 +184,150 @@ class ModelSportScraper:
                 logging.error(f"Error occurred on page {page_count}: {str(e)}")
                 break
 
-      
-        with open(output_file, 'w', newline='') as file:
-            writer = csv.writer(file)
-            for link in product_links:
-                writer.writerow([link])
+        logging.info(f"Total of {count} product links extracted.")
 
-        logging.info(f"Total of {len(product_links)} product links extracted.")
+    def get_product_links(self, output_file):
+        pipeline.save_links(frontier.unique_links(self.iter_product_links()), output_file, header=None)
+
+    def run_pipeline(self, output_file, product_urls_file=None, **kwargs):
+        # Streaming mode: details are extracted while links are still being
+        # discovered; product_urls_file, if given, is kept as a checkpoint.
+        lastmods = {}
+        links = frontier.unique_links(self.iter_product_links())
+        product_urls = pipeline.stream(links, checkpoint=product_urls_file, header=None, lastmods=lastmods)
+        self.extract_product_details(product_urls_file, output_file, product_urls=product_urls, lastmods=lastmods,
+                                     **kwargs)
+
+    def extract_product_details(self, product_urls_file, output_file, variant_urls_file='modelsport_variant_urls.csv', failed_urls_file='modelsport_failed_urls.csv', batch_size=50, per_host_limit=8, product_urls=None, incremental=False, lastmods=None):
+        # Incremental mode re-extracts only products whose sitemap lastmod
+        # changed since the last run into output_file.
+        self.delta = DeltaIndex(output_file) if incremental else None
+        if lastmods is None:
+            lastmods = pipeline.read_lastmods(product_urls_file) if incremental and product_urls_file else {}
+        self.lastmods = lastmods
+
+        # Resumes an interrupted crawl into the same output files
+        state = CrawlState(output_file)
+        with CrawlOutput(self.SITE, state, self.delta) as crawl:
+            if not crawl.resumed:
+                for file in [output_file, variant_urls_file, failed_urls_file]:
+                    if os.path.exists(file):
+                        os.remove(file)
+
+            if product_urls is None:
+                with open(product_urls_file, 'r') as file:
+                    product_urls = [row[0] for row in csv.reader(file) if row]
 
-    def extract_product_details(self, product_urls_file, output_file, variant_urls_file='modelsport_variant_urls.csv', failed_urls_file='modelsport_failed_urls.csv', batch_size=50):
-        for file in [output_file, variant_urls_file, failed_urls_file]:
-            if os.path.exists(file):
-                os.remove(file)
+            with open(output_file, 'a', newline='', encoding='utf-8') as output_csv, \
+                open(variant_urls_file, 'a', newline='', encoding='utf-8') as variant_csv, \
+                open(failed_urls_file, 'a', newline='', encoding='utf-8') as failed_csv:
+            
+                writer = csv.writer(output_csv)
+                variant_writer = csv.writer(variant_csv)
+                failed_writer = csv.writer(failed_csv)
 
-        with open(product_urls_file, 'r') as file:
-            product_urls = [line.strip() for line in file]
+                if os.stat(output_file).st_size == 0:
+                    writer.writerow(self.OUTPUT_FIELDS)
+                if os.stat(variant_urls_file).st_size == 0:
+                    variant_writer.writerow(['URL'])
+                if os.stat(failed_urls_file).st_size == 0:
+                    failed_writer.writerow(['URL'])
+                writer = crawl.writer(writer, self.OUTPUT_FIELDS)
 
-        with open(output_file, 'a', newline='', encoding='utf-8') as output_csv, \
-            open(variant_urls_file, 'a', newline='', encoding='utf-8') as variant_csv, \
-            open(failed_urls_file, 'a', newline='', encoding='utf-8') as failed_csv:
-            
-            writer = csv.writer(output_csv)
-            variant_writer = csv.writer(variant_csv)
-            failed_writer = csv.writer(failed_csv)
-
-            if os.stat(output_file).st_size == 0:
-                writer.writerow(['Title', 'Brand', 'SKU', 'Price', 'Stock Status', 'URL'])
-            if os.stat(variant_urls_file).st_size == 0:
-                variant_writer.writerow(['URL'])
-            if os.stat(failed_urls_file).st_size == 0:
-                failed_writer.writerow(['URL'])
-
-            for i in range(0, len(product_urls), batch_size):
-                batch_urls = product_urls[i:i + batch_size]
-                self.process_batch(batch_urls, writer, variant_writer, failed_writer)
-                output_csv.flush()
-                variant_csv.flush()
-                failed_csv.flush()
-                gc.collect()
-                time.sleep(10)
+                crawl.track(output_csv, variant_csv, failed_csv)
+                # One engine run over all URLs, so no batch waits for its slowest page
+                engine = FetchEngine(per_host_limit=per_host_limit)
+                self.process_urls(state.remaining(product_urls), writer, variant_writer, failed_writer, engine,
+                                  state, crawl.sinks, batch_size)
 
-        self.process_variant_urls(variant_urls_file, output_file, failed_urls_file)
+            self.process_variant_urls(variant_urls_file, output_file, failed_urls_file, state=state, sinks=crawl.sinks,
+                                      per_host_limit=per_host_limit)
+        self.delta = None
 
-    def process_batch(self, batch_urls, writer, variant_writer, failed_writer):
-        for url in batch_urls:
-            try:
-                response = requests.get(url, timeout=20)
-                time.sleep(1)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.content, 'html.parser')
-
-                # Check for variants
-                variants = soup.select('div.m-product-buttons-list-button.data')
-                if variants:
-                    variant_writer.writerow([url])
-                    logging.info(f"Variants found for {url}. URL added to variant_urls.csv")
-                    continue  # Skip processing and move to next URL
-
-                # Extract product details
-                title = soup.select_one('h1.m-product-title.product-title')
-                brand = soup.select_one('p.m-product-brand a.m-product-brand-link')
-                base_price = soup.select_one('meta[itemprop="price"]')
-                sku = soup.select_one('span.m-product-itemNumber-value')
-                stock_status_elem = soup.select_one('span.m-product-stock-text')
-
-                title_text = title.get_text(strip=True) if title else "N/A"
-                brand_text = brand['title'].split(': ')[-1] if brand and brand.has_attr('title') else "N/A"
-                price_text = base_price['content'] if base_price and base_price.has_attr('content') else "N/A"
-                sku_text = sku.get_text(strip=True) if sku else "N/A"
-                stock_status = self.get_stock_status_bs4(stock_status_elem)
-
-                writer.writerow([title_text, brand_text, sku_text, price_text, stock_status, url])
-                logging.info(f"Extracted details for {url}")
-
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Request error for {url}: {e}")
-                failed_writer.writerow([url])  # Append failed URL to file
-            except Exception as e:
-                logging.error(f"Error extracting details for {url}: {e}")
-                failed_writer.writerow([url])  # Append failed URL to file
+    def process_single_url(self, url):
+        lastmod = self.lastmods.get(url, '')
+        if self.delta:
+            carried = self.delta.carry(url, lastmod=lastmod)
+            if carried is not None:
+                return 'rows', carried  # Unchanged since the last run
 
-    def process_variant_urls(self, variant_urls_file, output_file, failed_urls_file='failed_urls.csv'):
-        self.chrome()
+        try:
+            response = http_client.get(url)
+            response.raise_for_status()
+            details = http_client.parsed(response, 'product-page', self.parse_product_page)
+            if details is None:
+                logging.info(f"Variants found for {url}. URL added to variant_urls.csv")
+                return 'variant', [url]  # Skip processing and move to next URL
+
+            logging.info(f"Extracted details for {url}")
+            if self.delta:
+                self.delta.record(url, [details + [url]], lastmod=lastmod)
+            return 'row', details + [url]
+
+        except requests.exceptions.RequestException:
+            raise  # Retried by the fetch engine
+        except Exception as e:
+            logging.error(f"Error extracting details for {url}: {e}")
+            return 'failed', [url]  # Goes to the failed URLs file
+
+    def parse_product_page(self, response):
+        return html_parser.extract(response.content, self.read_product_page, only=self.PRODUCT_PAGE_PARTS)
+
+    def read_product_page(self, soup):
+
+        # Check for variants
+        variants = soup.select('div.m-product-buttons-list-button.data')
+        if variants:
+            return None
+
+        # Extract product details
+        title = soup.select_one('h1.m-product-title.product-title')
+        brand = soup.select_one('p.m-product-brand a.m-product-brand-link')
+        base_price = soup.select_one('meta[itemprop="price"]')
+        sku = soup.select_one('span.m-product-itemNumber-value')
+        stock_status_elem = soup.select_one('span.m-product-stock-text')
+
+        title_text = title.get_text(strip=True) if title else "N/A"
+        brand_text = brand['title'].split(': ')[-1] if brand and brand.has_attr('title') else "N/A"
+        price_text = base_price['content'] if base_price and base_price.has_attr('content') else "N/A"
+        sku_text = sku.get_text(strip=True) if sku else "N/A"
+        stock_status = self.get_stock_status_bs4(stock_status_elem)
+
+        return [title_text, brand_text, sku_text, price_text, stock_status]
+
+    def process_urls(self, urls, writer, variant_writer, failed_writer, engine=None, state=None, sinks=(),
+                     batch_size=50):
+        # Progress is committed and memory reclaimed every batch_size results
+        engine = engine or FetchEngine()
+        writers = {'row': writer.writerow, 'rows': writer.writerows,
+                   'variant': variant_writer.writerow, 'failed': failed_writer.writerow}
+        statuses = {'row': DONE, 'rows': DONE, 'variant': VARIANT, 'failed': FAILED}
+        for count, (url, result, error) in enumerate(engine.map(self.process_single_url, urls), 1):
+            if error:
+                logging.error(f"Request error for {url}: {error}")
+                result = ('failed', [url])
+            kind, row = result
+            if kind == 'failed':
+                for sink in sinks:
+                    sink.keep(url)
+            writers[kind](row)
+            if state:
+                state.mark(url, statuses[kind])
+            if count % batch_size == 0:
+                if state:
+                    state.flush()
+                gc.collect()
+        if state:
+            state.flush()
+
+    def process_variant_urls(self, variant_urls_file, output_file, failed_urls_file='failed_urls.csv', browsers=DEFAULT_SIZE, state=None, sinks=(), per_host_limit=8):
+        resolver = VariantResolver(self.get_stock_status_bs4)
         try:
             with open(variant_urls_file, 'r') as file:
                 variant_urls = [line.strip() for line in file if line.strip() != 'URL']  # Skip header
+            if state:
+                # Variant pages finished before an interruption are skipped
+                variant_urls = [url for url in variant_urls if state.status(url) not in (DONE, FAILED)]
 
             with open(output_file, 'a', newline='', encoding='utf-8') as output_csv, \
                 open(failed_urls_file, 'a', newline='', encoding='utf-8') as failed_csv:
@@ -228,55 +337,52 @@ class ModelSportScraper:
 
                 # Write headers if the files are empty
                 if os.stat(output_file).st_size == 0:
-                    writer.writerow(['Title', 'Brand', 'SKU', 'Price', 'Stock Status', 'URL'])
+                    writer.writerow(self.OUTPUT_FIELDS)
                 if os.stat(failed_urls_file).st_size == 0:
                     failed_writer.writerow(['URL'])
-
-                for url in variant_urls:
-                    try:
-                        self.driver.get(url)
-                        time.sleep(2)
-                        WebDriverWait(self.driver, 15).until(EC.presence_of_element_located((By.ID, 'zoomHook')))
-
-                        title = self.get_element_text(By.CSS_SELECTOR, 'h1.m-product-title.product-title', default="N/A")
-                        brand = self.get_element_attribute(By.CSS_SELECTOR, 'p.m-product-brand a.m-product-brand-link', 'title', default="N/A").split(': ')[-1]
-                        base_price = self.get_element_attribute(By.CSS_SELECTOR, 'meta[itemprop="price"]', 'content', default="N/A")
-                        sku = self.get_element_text(By.CSS_SELECTOR, 'span.m-product-itemNumber-value', default="N/A")
-                        stock_status = self.get_stock_status(By.CSS_SELECTOR, 'span.m-product-stock-text')
-
-                        variants = self.driver.find_elements(By.CSS_SELECTOR, 'div.m-product-buttons-list-button.data')
-                        if variants:
-                            for variant in variants:
-                                try:
-                                    label = variant.find_element(By.TAG_NAME, 'label')
-                                    self.driver.execute_script("arguments[0].click();", label)
-                                    time.sleep(2.5)
-                                except:
-                                    try:
-                                        label = variant.find_element(By.TAG_NAME, 'label')
-                                        label.click()
-                                        time.sleep(2)
-                                    except Exception as e:
-                                        logging.error(f"Error clicking variant for {url}: {e}")
-                                        continue
-
-                                variant_price = self.get_element_text(By.CSS_SELECTOR, 'span.selected-priceLine .price', default="N/A")
-                                variant_sku = self.get_element_text(By.CSS_SELECTOR, 'span.product-itemNumber-value.selected-itemNumber-value', default="N/A")
-                                variant_stock_status = self.get_stock_status(By.CSS_SELECTOR, 'span.product-stock-text.selected-stock-text')
-                                writer.writerow([title, brand, variant_sku, variant_price, variant_stock_status, url])
-                                logging.info(f"Extracted variant details for {url}")
-                        else:
-                            writer.writerow([title, brand, sku, base_price, stock_status, url])
-                            logging.info(f"Extracted details for {url} without variants")
-
-                    except Exception as e:
-                        logging.error(f"Error processing variant URL {url}: {e}")
+                writer = RowWriter(writer, sinks, self.OUTPUT_FIELDS)
+                if state:
+                    state.track(output_csv, failed_csv, *sinks)
+
+                # Variant pages resolve concurrently over HTTP; the ones that
+                # cannot (None or an error) go to the browser pool
+                browser_urls = []
+                engine = FetchEngine(per_host_limit=per_host_limit)
+                for url, variant_rows, error in engine.map(resolver.resolve, variant_urls):
+                    if error:
+                        logging.error(f"Error resolving variants over HTTP for {url}: {error}")
+                    if variant_rows:
+                        variant_rows = [row + [url] for row in variant_rows]
+                        writer.writerows(variant_rows)
+                        if self.delta:
+                            self.delta.record(url, variant_rows, lastmod=self.lastmods.get(url, ''))
+                        if state:
+                            state.mark(url, DONE)
+                    else:
+                        browser_urls.append(url)
+
+                # The rest can only be read by clicking through the variants
+                logging.info(f"{len(browser_urls)} of {len(variant_urls)} variant URLs need the browser.")
+                pool = BrowserPool(self.new_driver, size=browsers, warm_up=self.warm_up)
+                for url, rows, error in pool.map(self.read_variants_in_browser, browser_urls):
+                    if error:
+                        logging.error(f"Error processing variant URL {url}: {error}")
                         failed_writer.writerow([url])  # Append failed URL to file
+                        writer.keep(url)
+                        if state:
+                            state.mark(url, FAILED)
+                        continue
+                    writer.writerows(rows)
+                    logging.info(f"Extracted {len(rows)} variant rows for {url}")
+                    if self.delta:
+                        self.delta.record(url, rows, lastmod=self.lastmods.get(url, ''))
+                    if state:
+                        state.mark(url, DONE)
+                if state:
+                    state.flush()
 
         except FileNotFoundError:
             logging.error(f"{variant_urls_file} not found.")
-        except Exception as e:
-            logging.error(f"Error processing variant URLs: {e}")
 
     def get_stock_status_bs4(self, stock_element):
         try:
@@ -290,21 +396,72 @@ class ModelSportScraper:
         except Exception:
             return "N/A"
 
-    def get_element_text(self, by, selector, default=""):
+    def read_variants_in_browser(self, driver, url):
+        if not wait_strategy.load(driver, url, self.PRODUCT_READY, 'product'):
+            raise TimeoutException(f"Product page not ready: {url}")
+
+        title = self.get_element_text(driver, By.CSS_SELECTOR, 'h1.m-product-title.product-title', default="N/A")
+        brand = self.get_element_attribute(driver, By.CSS_SELECTOR, 'p.m-product-brand a.m-product-brand-link', 'title', default="N/A").split(': ')[-1]
+        base_price = self.get_element_attribute(driver, By.CSS_SELECTOR, 'meta[itemprop="price"]', 'content', default="N/A")
+        sku = self.get_element_text(driver, By.CSS_SELECTOR, 'span.m-product-itemNumber-value', default="N/A")
+        stock_status = self.get_stock_status(driver, By.CSS_SELECTOR, 'span.m-product-stock-text')
+
+        rows = []
+        variants = driver.find_elements(By.CSS_SELECTOR, 'div.m-product-buttons-list-button.data')
+        if variants:
+            for variant in variants:
+                previous_sku = self.get_element_text(driver, By.CSS_SELECTOR, variant_resolver.SELECTED_SKU, default="N/A")
+                already_selected = self.is_variant_selected(variant)
+                try:
+                    label = variant.find_element(By.TAG_NAME, 'label')
+                    driver.execute_script("arguments[0].click();", label)
+                except:
+                    try:
+                        label = variant.find_element(By.TAG_NAME, 'label')
+                        label.click()
+                    except Exception as e:
+                        logging.error(f"Error clicking variant for {url}: {e}")
+                        continue
+                if not already_selected:
+                    self.wait_for_variant_change(driver, previous_sku)
+
+                variant_price = self.get_element_text(driver, By.CSS_SELECTOR, variant_resolver.SELECTED_PRICE, default="N/A")
+                variant_sku = self.get_element_text(driver, By.CSS_SELECTOR, variant_resolver.SELECTED_SKU, default="N/A")
+                variant_stock_status = self.get_stock_status(driver, By.CSS_SELECTOR, variant_resolver.SELECTED_STOCK)
+                rows.append([title, brand, variant_sku, variant_price, variant_stock_status, url])
+        else:
+            rows.append([title, brand, sku, base_price, stock_status, url])
+
+        return rows
+
+    def is_variant_selected(self, variant):
+        try:
+            return variant.find_element(By.TAG_NAME, 'input').is_selected()
+        except Exception:
+            return False
+
+    def wait_for_variant_change(self, driver, previous_sku, timeout=10):
+        # The variant's price, SKU and stock are swapped in by AJAX; wait for
+        # the selected SKU to change rather than sleeping a fixed time.
+        changed = lambda driver: self.get_element_text(driver, By.CSS_SELECTOR, variant_resolver.SELECTED_SKU, default="N/A") != previous_sku
+        if not wait_strategy.wait(driver, changed, 'variant', timeout):
+            logging.warning(f"Selected SKU stayed {previous_sku} after clicking a variant")
+
+    def get_element_text(self, driver, by, selector, default=""):
         try:
-            return self.driver.find_element(by, selector).text
+            return driver.find_element(by, selector).text
         except Exception:
             return default
 
-    def get_element_attribute(self, by, selector, attribute, default=""):
+    def get_element_attribute(self, driver, by, selector, attribute, default=""):
         try:
-            return self.driver.find_element(by, selector).get_attribute(attribute)
+            return driver.find_element(by, selector).get_attribute(attribute)
         except Exception:
             return default
 
-    def get_stock_status(self, by, selector):
+    def get_stock_status(self, driver, by, selector):
         try:
-            stock_text = self.driver.find_element(by, selector).text
+            stock_text = driver.find_element(by, selector).text
             if "Ikke på lager" in stock_text:
                 return "Out of Stock"
             elif "På Lager" in stock_text:
@@ -314,7 +471,11 @@ class ModelSportScraper:
         except Exception:
             return "N/A"
     def close_driver(self):
-        self.driver.quit()
+        chrome_driver.log_stats()
+        wait_strategy.log_stats()
+        if self.driver:
+            self.driver.quit()
+            self.driver = None
 
 if __name__ == "__main__":
     scraper = ModelSportScraper()
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import http_client
+from retry import RetryPolicy
+
+# asyncio based fetch engine for the HTTP detail stages. Every URL is handed to
+# a blocking worker function (the scrapers' extract_details) which runs on a
+# thread pool, while the event loop keeps up to `global_limit` URLs in flight
+# overall and at most `per_host_limit` per host. Failed URLs are retried
+# according to the retry policy without holding a thread or a host slot while
+# they wait. Results are yielded as soon as they complete so the caller can
+# stream rows to its output file.
+
+DEFAULT_PER_HOST_LIMIT = 8
+DEFAULT_GLOBAL_LIMIT = 64
+
+_DONE = object()
+
+
+class FetchEngine:
+    def __init__(self, per_host_limit=DEFAULT_PER_HOST_LIMIT, global_limit=DEFAULT_GLOBAL_LIMIT, retry_policy=None):
+        self.per_host_limit = per_host_limit
+        self.global_limit = max(global_limit, per_host_limit)
+        self.retry_policy = retry_policy or RetryPolicy()
+        http_client.get_client(pool_size=per_host_limit)
+
+    def map(self, func, urls):
+        # Yields (url, result, error) tuples in completion order.
+        results = queue.Queue()
+        thread = threading.Thread(target=self._run_loop, args=(func, urls, results), daemon=True)
+        thread.start()
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                thread.join()
+                raise item
+            yield item
+        thread.join()
+
+    def _run_loop(self, func, urls, results):
+        outcome = _DONE
+        try:
+            asyncio.run(self._run(func, urls, results))
+        except Exception as e:
+            logging.error(f"Fetch engine stopped: {e}")
+            outcome = e
+        finally:
+            results.put(outcome)
+
+    async def _run(self, func, urls, results):
+        loop = asyncio.get_running_loop()
+        global_slots = asyncio.Semaphore(self.global_limit)
+        host_slots = defaultdict(lambda: asyncio.Semaphore(self.per_host_limit))
+        tasks = set()
+        url_iter = iter(urls)
+        source_error = None
+
+        with ThreadPoolExecutor(max_workers=self.global_limit) as executor:
+            async def run_one(url):
+                attempt = 0
+                spent = 0.0
+                try:
+                    while True:
+                        try:
+                            async with host_slots[urlsplit(url).netloc]:
+                                result = await loop.run_in_executor(executor, func, url)
+                            results.put((url, result, None))
+                            return
+                        except Exception as e:
+                            delay = self.retry_policy.next_delay(url, attempt, e, spent)
+                            if delay is None:
+                                results.put((url, None, e))
+                                return
+                        # Give the slot back while waiting so other URLs keep flowing.
+                        global_slots.release()
+                        try:
+                            await asyncio.sleep(delay)
+                        finally:
+                            await global_slots.acquire()
+                        spent += delay
+                        attempt += 1
+                finally:
+                    global_slots.release()
+
+            while True:
+                # The URL source may block (e.g. a queue fed by link discovery),
+                # so pull from it off the event loop.
+                try:
+                    url = await loop.run_in_executor(None, next, url_iter, _DONE)
+                except Exception as e:
+                    source_error = e  # Raised once the URLs in flight are done
+                    break
+                if url is _DONE:
+                    break
+                await global_slots.acquire()
+                task = asyncio.create_task(run_one(url))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+            if source_error:
+                raise source_error
@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import math
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+# Canonical URLs and deduplication for link discovery. The same product is
+# linked from many collections, with ?variant= and tracking query strings,
+# and each spelling used to become its own detail fetch and its own output
+# rows. canonical() reduces a product link to one form and a Frontier
+# remembers which forms were already handed on: in an exact set up to
+# max_exact URLs, beyond that in a fixed size bloom filter (which may drop a
+# new URL with probability error_rate, but never lets a duplicate through).
+
+DEFAULT_MAX_EXACT = 1000000
+BLOOM_CAPACITY = 10000000
+BLOOM_ERROR_RATE = 0.001
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Shopify serves /collections/<collection>/products/<handle> as /products/<handle>
+SHOPIFY_COLLECTION_PRODUCT = re.compile(r'^(?:/[a-z]{2}(?:-[a-z]{2})?)?/collections/[^/]+(/products/[^/]+)', re.I)
+
+
+def canonical(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r'/{2,}', '/', parts.path) or '/'
+    match = SHOPIFY_COLLECTION_PRODUCT.match(path)
+    if match:
+        path = match.group(1)
+    # Query and fragment only select variants, tabs or tracking
+    return urlunsplit((scheme, host, path, '', ''))
+
+
+class BloomFilter:
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def add(self, item):
+        # Returns True when the item was not in the filter yet
+        new = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                new = True
+        return new
+
+
+class Frontier:
+    def __init__(self, max_exact=DEFAULT_MAX_EXACT):
+        self.max_exact = max_exact
+        self.exact = set()
+        self.bloom = None
+        self.added = 0
+        self.duplicates = 0
+
+    def add(self, url):
+        # Returns True for a URL not seen before
+        if self.bloom is not None:
+            new = self.bloom.add(url)
+        elif url in self.exact:
+            new = False
+        else:
+            self.exact.add(url)
+            new = True
+            if len(self.exact) > self.max_exact:
+                logging.info(f"Frontier passed {self.max_exact} URLs, switching to a bloom filter")
+                self.bloom = BloomFilter()
+                for seen in self.exact:
+                    self.bloom.add(seen)
+                self.exact = set()
+        if new:
+            self.added += 1
+        else:
+            self.duplicates += 1
+        return new
+
+
+def unique_links(links, frontier=None):
+    # Yields the (url, lastmod, ...) rows of `links` with canonical URLs,
+    # skipping URLs already yielded.
+    frontier = frontier or Frontier()
+    for row in links:
+        url = canonical(row[0])
+        if frontier.add(url):
+            yield (url,) + tuple(row[1:])
+    logging.info(f"Link discovery: {frontier.added} unique URLs, {frontier.duplicates} duplicates dropped")
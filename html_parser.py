@@ -0,0 +1,157 @@
+import logging
+import os
+import time
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Pluggable HTML parser backend. The scrapers only run a handful of CSS
+# selectors on each page, so they describe the parts they need (`ParseOnly`)
+# and get back a document with the familiar select / select_one / get_text /
+# attribute API, whichever parser built it:
+#
+#   html.parser  - BeautifulSoup with the pure Python parser (previous behaviour)
+#   lxml         - BeautifulSoup with the C based lxml tree builder
+#   selectolax   - the Lexbor based selectolax parser wrapped in the same API
+#
+# The backend stays html.parser unless SCRAPER_HTML_PARSER names another one.
+# With SCRAPER_HTML_PARSER_COMPARE=1 every page is also run through the other
+# installed backends and through a full (non selective) parse, and timings and
+# any difference in the extracted values are logged; switch a site to lxml or
+# selectolax only once that shows no differences.
+
+BACKENDS = ('html.parser', 'lxml', 'selectolax')
+
+
+def _available(backend):
+    if backend == 'html.parser':
+        return True
+    try:
+        __import__('lxml' if backend == 'lxml' else 'selectolax.lexbor')
+        return True
+    except ImportError:
+        return False
+
+
+AVAILABLE_BACKENDS = [backend for backend in BACKENDS if _available(backend)]
+DEFAULT_BACKEND = os.environ.get('SCRAPER_HTML_PARSER') or 'html.parser'
+if DEFAULT_BACKEND not in AVAILABLE_BACKENDS:
+    logging.warning(f"HTML parser {DEFAULT_BACKEND} is not installed, using html.parser")
+    DEFAULT_BACKEND = 'html.parser'
+COMPARE_BACKENDS = os.environ.get('SCRAPER_HTML_PARSER_COMPARE') == '1'
+
+
+class ParseOnly:
+    # Describes the subtrees a scraper queries: elements carrying one of
+    # `classes`, tags named in `tags`, or tags whose attribute equals the
+    # value given in `attrs`. Each matching element is kept with its whole
+    # subtree, so descendant selectors below a kept element still work.
+    def __init__(self, classes=(), tags=(), attrs=None):
+        self.classes = set(classes)
+        self.tags = set(tags)
+        self.attrs = attrs or {}
+
+    def keep(self, name, attrs):
+        attrs = attrs or {}
+        if name in self.tags:
+            return True
+        for key, value in self.attrs.items():
+            if attrs.get(key) == value:
+                return True
+        classes = attrs.get('class') or ''
+        if isinstance(classes, str):
+            classes = classes.split()
+        return bool(self.classes.intersection(classes))
+
+    def strainer(self):
+        return _PartsStrainer(self)
+
+
+class _PartsStrainer(SoupStrainer):
+    # BeautifulSoup < 4.13 calls the name function with (name, attrs) while
+    # parsing; newer releases ask allow_tag_creation / allow_string_creation.
+    def __init__(self, parts):
+        super().__init__(parts.keep)
+        self.parts = parts
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self.parts.keep(name, attrs)
+
+    def allow_string_creation(self, string):
+        return False
+
+
+class _SelectolaxNode:
+    def __init__(self, node):
+        self.node = node
+
+    def select_one(self, selector):
+        node = self.node.css_first(selector)
+        return _SelectolaxNode(node) if node is not None else None
+
+    def select(self, selector):
+        return [_SelectolaxNode(node) for node in self.node.css(selector)]
+
+    def get_text(self, separator='', strip=False):
+        return self.node.text(deep=True, separator=separator, strip=strip)
+
+    @property
+    def parent(self):
+        node = self.node.parent
+        return _SelectolaxNode(node) if node is not None else None
+
+    @property
+    def string(self):
+        return self.node.text(deep=True)
+
+    def has_attr(self, name):
+        return name in self.node.attributes
+
+    def get(self, name, default=None):
+        value = self.node.attributes.get(name)
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        return self.node.attributes[name]
+
+
+def parse(content, backend=None, only=None):
+    backend = backend or DEFAULT_BACKEND
+    if backend == 'selectolax':
+        from selectolax.lexbor import LexborHTMLParser
+        return _SelectolaxNode(LexborHTMLParser(content))
+    parse_only = only.strainer() if only else None
+    return BeautifulSoup(content, backend, parse_only=parse_only)
+
+
+def extract(content, extract_fields, only=None, backend=None):
+    # Parses `content` and returns extract_fields(document). In compare mode
+    # the other installed backends run as well and disagreements are logged.
+    backend = backend or DEFAULT_BACKEND
+    if not COMPARE_BACKENDS:
+        return extract_fields(parse(content, backend, only))
+    return compare(content, extract_fields, only, backend)
+
+
+def compare(content, extract_fields, only=None, primary=None):
+    primary = primary or DEFAULT_BACKEND
+    runs = [(primary, primary, only)]
+    if only:
+        # Also check that selective parsing did not drop anything.
+        runs.append((f"{primary} (full)", primary, None))
+    runs += [(backend, backend, only) for backend in AVAILABLE_BACKENDS if backend != primary]
+
+    results = {}
+    for label, backend, parts in runs:
+        start = time.perf_counter()
+        try:
+            results[label] = extract_fields(parse(content, backend, parts))
+        except Exception as e:
+            results[label] = e
+        logging.info(f"HTML parser {label}: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    for label, result in results.items():
+        if label != primary and result != results[primary]:
+            logging.warning(f"HTML parser mismatch: {primary}={results[primary]!r} {label}={result!r}")
+    if isinstance(results[primary], Exception):
+        raise results[primary]
+    return results[primary]
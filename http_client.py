@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limiter import AdaptiveRateLimiter
+from response_cache import DEFAULT_PATH as CACHE_PATH, ResponseCache
+
+# Shared HTTP client used by every scraper. One requests.Session keeps a
+# keep-alive pool per host so product fetches reuse TCP/TLS connections
+# instead of paying a fresh handshake on every requests.get call. Responses
+# go through an on-disk cache with conditional revalidation (response_cache).
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'da-DK,da;q=0.9,sv;q=0.8,en;q=0.7',
+}
+DEFAULT_TIMEOUT = (10, 20)  # (connect, read) in seconds
+DEFAULT_POOL_SIZE = 10
+MAX_HOSTS = 20
+
+
+class HttpClient:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, headers=None, timeout=DEFAULT_TIMEOUT, cache_path=CACHE_PATH):
+        self.timeout = timeout
+        self.limiter = AdaptiveRateLimiter()
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            self.session.headers.update(headers)
+        self.pool_size = 0
+        self.resize(pool_size)
+
+    def resize(self, pool_size):
+        # pool_maxsize is the number of keep-alive connections kept per host,
+        # so it has to match the number of workers hitting the same site.
+        if pool_size <= self.pool_size:
+            return
+        adapter = HTTPAdapter(pool_connections=MAX_HOSTS, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+        logging.info(f"HTTP client pool size set to {pool_size} connections per host")
+
+    def get(self, url, cache=True, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if kwargs.get('params'):
+            # The query string is part of the cache key
+            url = requests.Request('GET', url, params=kwargs.pop('params')).prepare().url
+        cache = self.cache if cache else None
+        entry = cache.lookup(url) if cache else None
+        if entry:
+            if cache.is_fresh(entry):
+                return cache.to_response(url, entry)
+            headers = dict(kwargs.get('headers') or {})
+            headers.update(cache.conditional_headers(entry))
+            kwargs['headers'] = headers
+
+        host = urlsplit(url).netloc
+        self.limiter.acquire(host)
+        start = time.monotonic()
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.RequestException:
+            self.limiter.record(host, None, time.monotonic() - start)
+            raise
+        self.limiter.record(host, response.status_code, time.monotonic() - start)
+
+        if entry and response.status_code == 304:
+            cache.touch(url)
+            return cache.to_response(url, entry)
+        response.cache_key = url
+        if cache and response.status_code == 200:
+            cache.store(url, response)
+        return response
+
+    def parsed(self, response, key, parse):
+        # parse(response), with the result cached under key unless key is
+        # None. A body that does not parse is dropped from the cache, so the
+        # retry of a truncated page goes to the network again.
+        if self.cache is None:
+            return parse(response)
+        try:
+            if key is None:
+                return parse(response)
+            return self.cache.parsed(response, key, parse)
+        except Exception:
+            self.cache.discard(getattr(response, 'cache_key', response.url))
+            raise
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client(pool_size=None):
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(pool_size or DEFAULT_POOL_SIZE)
+        elif pool_size:
+            _client.resize(pool_size)
+        return _client
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def parsed(response, key, parse):
+    return get_client().parsed(response, key, parse)
@@ -0,0 +1,61 @@
+# Detail rows are written through a RowWriter: the row goes to the CSV writer
+# as before and, as a dict keyed by the output columns, to every sink (the
+# change feed, the store). Sinks implement write(row) and keep(url); keep()
+# tells them a page failed this run, so its previous rows are still current.
+# Sinks key a row by row[KEY]: its SKU, else its variant name, else its
+# position among the rows of its URL ("#2"), since many variants have no SKU.
+
+KEY = '_key'
+
+
+def row_dict(row, fieldnames=None):
+    return dict(zip(fieldnames, row)) if fieldnames else row
+
+
+def variant_key(row, position=1):
+    for column in ('SKU', 'Variants'):
+        value = str(row.get(column) or '').strip()
+        if value and value != 'N/A':
+            return value
+    return f"#{position}"
+
+
+def is_placeholder(row):
+    # The all 'N/A' row written for a page that could not be read
+    title = row.get('Title', row.get('Product Name'))
+    return not row.get('URL') or row.get('URL') == 'N/A' or (title == 'N/A' and row.get('SKU') == 'N/A')
+
+
+class RowWriter:
+    # fieldnames name the columns of list rows (csv.writer); rows for a
+    # csv.DictWriter are dicts already.
+    def __init__(self, writer, sinks, fieldnames=None):
+        self.writer = writer
+        self.sinks = [sink for sink in sinks if sink is not None]
+        self.fieldnames = fieldnames
+        self.url = None
+        self.position = 0
+
+    def writeheader(self):
+        return self.writer.writeheader()
+
+    def writerow(self, row):
+        # A copy: a csv.DictWriter refuses the extra key
+        values = dict(row_dict(row, self.fieldnames))
+        # The rows of one page are written one after another
+        if values.get('URL') != self.url:
+            self.url = values.get('URL')
+            self.position = 0
+        self.position += 1
+        values[KEY] = variant_key(values, self.position)
+        for sink in self.sinks:
+            sink.write(values)
+        return self.writer.writerow(row)
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def keep(self, url):
+        for sink in self.sinks:
+            sink.keep(url)
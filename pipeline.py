@@ -0,0 +1,81 @@
+import csv
+import logging
+import queue
+import threading
+
+# Streaming hand-off between link discovery and detail extraction. stream()
+# runs a scraper's link generator in a producer thread and returns a
+# blocking iterator over a bounded queue, so the detail workers (FetchEngine
+# pulls its input lazily) start on the first product while discovery is still
+# paging. The links CSV becomes an optional checkpoint written as links are
+# found. If a `lastmods` dict is given it is filled with each URL's lastmod
+# before the URL is handed out, for incremental crawls. An error in discovery
+# is raised from the iterator after the last URL found, so the crawl does not
+# mistake a partial URL list for the whole site.
+
+DEFAULT_QUEUE_SIZE = 1000
+LINK_FIELDS = ['Product Link', 'Last Modified']
+
+_DONE = object()
+
+
+def save_links(links, path, header=LINK_FIELDS):
+    # Writes (url, lastmod) rows to path and returns how many were written.
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        if header:
+            writer.writerow(header)
+        for row in links:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def read_lastmods(path):
+    # {url: lastmod} from a links CSV, with or without the header row
+    with open(path, 'r', encoding='utf-8') as file:
+        rows = [row for row in csv.reader(file) if row]
+    if rows and rows[0][0] == LINK_FIELDS[0]:
+        rows = rows[1:]
+    return {row[0]: row[1] if len(row) > 1 else '' for row in rows}
+
+
+def stream(links, checkpoint=None, header=LINK_FIELDS, maxsize=DEFAULT_QUEUE_SIZE, lastmods=None):
+    # Yields the URL (first column) of every row `links` produces, as soon as
+    # it is produced. Discovery blocks once `maxsize` URLs are waiting.
+    found = queue.Queue(maxsize=maxsize)
+
+    def produce():
+        file = open(checkpoint, 'w', newline='', encoding='utf-8') if checkpoint else None
+        count = 0
+        outcome = _DONE
+        try:
+            writer = csv.writer(file) if file else None
+            if writer and header:
+                writer.writerow(header)
+            for row in links:
+                if writer:
+                    writer.writerow(row)
+                    file.flush()
+                if lastmods is not None and len(row) > 1:
+                    lastmods[row[0]] = row[1]
+                found.put(row[0])
+                count += 1
+        except Exception as e:
+            logging.error(f"Link discovery stopped after {count} links: {e}")
+            outcome = e  # Raised to the consumer once the links found are used
+        finally:
+            if file:
+                file.close()
+            logging.info(f"Link discovery finished with {count} links")
+            found.put(outcome)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        url = found.get()
+        if url is _DONE:
+            return
+        if isinstance(url, Exception):
+            raise url
+        yield url
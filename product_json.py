@@ -0,0 +1,81 @@
+import json
+import logging
+import re
+import threading
+import time
+
+import html_parser
+
+# Fast extraction of the product JSON Shopify themes embed in a <script> tag.
+# The script is located with a regex straight on the response bytes and only
+# when that fails is the page parsed (see html_parser). Every call records the
+# path it took and how long it spent, so the CPU saving can be measured.
+
+FAST = 'fast'
+PARSER = 'parser'
+MISSING = 'missing'
+
+_stats = {FAST: [0, 0.0], PARSER: [0, 0.0], MISSING: [0, 0.0]}
+_stats_lock = threading.Lock()
+
+
+def _script_pattern(script_class=None, script_id_prefix=None):
+    # Same match as the parser fallback: a whole class token, or an id
+    # starting with the prefix
+    if script_class:
+        attribute = (rb'(?<![\w-])class=(?P<quote>["\'])(?:[^"\']*\s)?' + re.escape(script_class.encode())
+                     + rb'(?:\s[^"\']*)?(?P=quote)')
+    else:
+        attribute = rb'(?<![\w-])id=["\']' + re.escape(script_id_prefix.encode()) + rb'[^"\']*["\']'
+    return re.compile(rb'<script\b[^>]*' + attribute + rb'[^>]*>(?P<json>.*?)</script\s*>', re.S | re.I)
+
+
+_patterns = {}
+_SCRIPTS_ONLY = html_parser.ParseOnly(tags=['script'])
+
+
+def _record(path, start):
+    with _stats_lock:
+        _stats[path][0] += 1
+        _stats[path][1] += time.perf_counter() - start
+
+
+def extract(content, script_class=None, script_id_prefix=None):
+    # Returns (product_data, path); product_data is None when no JSON is found.
+    start = time.perf_counter()
+    key = (script_class, script_id_prefix)
+    if key not in _patterns:
+        _patterns[key] = _script_pattern(script_class, script_id_prefix)
+
+    match = _patterns[key].search(content)
+    if match:
+        try:
+            data = json.loads(match.group('json'))
+            _record(FAST, start)
+            return data, FAST
+        except ValueError:
+            pass
+
+    soup = html_parser.parse(content, only=_SCRIPTS_ONLY)
+    if script_class:
+        script_element = soup.select_one(f'script.{script_class}')
+    else:
+        script_element = soup.select_one(f'script[id^="{script_id_prefix}"]')
+    if script_element and script_element.string:
+        data = json.loads(script_element.string)
+        _record(PARSER, start)
+        return data, PARSER
+
+    _record(MISSING, start)
+    return None, MISSING
+
+
+def stats():
+    with _stats_lock:
+        return {path: {'count': count, 'avg_ms': (total / count * 1000) if count else 0.0}
+                for path, (count, total) in _stats.items()}
+
+
+def log_stats():
+    for path, values in stats().items():
+        logging.info(f"Product JSON {path} path: {values['count']} pages, {values['avg_ms']:.2f} ms avg")
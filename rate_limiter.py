@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+
+# Adaptive per-host rate limiting. Every host gets a token bucket whose rate is
+# tuned AIMD style: it grows additively while responses stay fast and clean and
+# is cut multiplicatively on 429/503 responses, connection errors or when the
+# response latency starts climbing. This replaces the fixed time.sleep calls
+# the scrapers used for throttling.
+
+DEFAULT_INITIAL_RATE = 2.0  # requests per second
+DEFAULT_MIN_RATE = 0.1
+DEFAULT_MAX_RATE = 25.0
+DEFAULT_BURST = 4
+ADDITIVE_INCREASE = 0.2
+MULTIPLICATIVE_DECREASE = 0.5
+LATENCY_RISE_FACTOR = 2.0
+DECREASE_COOLDOWN = 2.0  # seconds between two rate cuts on the same host
+THROTTLE_STATUSES = (429, 503)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=DEFAULT_BURST, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.fast_latency = None
+        self.slow_latency = None
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Reserve a token (the balance may go negative) and sleep outside the
+        # lock, so concurrent workers queue up fairly behind each other.
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = max(0.0, -self.tokens / self.rate, self.paused_until - now)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def increase(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + ADDITIVE_INCREASE)
+
+    def decrease(self, pause=0.0):
+        with self.lock:
+            now = time.monotonic()
+            if pause:
+                self.paused_until = max(self.paused_until, now + pause)
+            if now - self.last_decrease < DECREASE_COOLDOWN:
+                return False
+            self.rate = max(self.min_rate, self.rate * MULTIPLICATIVE_DECREASE)
+            self.tokens = min(self.tokens, 0)
+            self.last_decrease = now
+            return True
+
+    def observe_latency(self, latency):
+        # Returns True when the short-term latency average has risen well above
+        # the long-term one, i.e. the host is starting to struggle.
+        with self.lock:
+            if self.fast_latency is None:
+                self.fast_latency = self.slow_latency = latency
+                return False
+            self.fast_latency = 0.3 * latency + 0.7 * self.fast_latency
+            self.slow_latency = 0.02 * latency + 0.98 * self.slow_latency
+            return self.fast_latency > self.slow_latency * LATENCY_RISE_FACTOR
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, initial_rate=DEFAULT_INITIAL_RATE, burst=DEFAULT_BURST, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE):
+        self.initial_rate = initial_rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.initial_rate, self.burst, self.min_rate, self.max_rate)
+            return self.buckets[host]
+
+    def acquire(self, host):
+        return self.bucket(host).acquire()
+
+    def record(self, host, status_code, latency):
+        # status_code is None when the request failed before getting a response.
+        bucket = self.bucket(host)
+        latency_rising = bucket.observe_latency(latency)
+        if status_code is None or status_code in THROTTLE_STATUSES or latency_rising:
+            if bucket.decrease():
+                logging.warning(f"Backing off {host} to {bucket.rate:.2f} req/s (status {status_code}, latency {latency:.2f}s)")
+        elif status_code < 500:
+            bucket.increase()
+
+    def pause(self, host, seconds):
+        # Used when the server tells us how long to stay away (Retry-After).
+        bucket = self.bucket(host)
+        if bucket.decrease(pause=seconds):
+            logging.warning(f"Pausing {host} for {seconds:.1f}s, rate now {bucket.rate:.2f} req/s")
+
+    def rate(self, host):
+        return self.bucket(host).rate
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Persistent HTTP response cache used by the shared HTTP client. Bodies are
+# stored with their validators (ETag / Last-Modified) in a SQLite file. Fresh
+# entries are served without touching the network, stale ones are revalidated
+# with a conditional request, and a 304 is answered from disk. Parse results
+# can be cached next to the body so an unchanged page is not parsed again.
+# The file is kept under `max_bytes` by evicting least recently used entries.
+# Lookups stay read only: access times are only refreshed when older than
+# ACCESS_INTERVAL, and those updates are written in batches. The size total
+# is re-read from the file every SIZE_RECOUNT stores, since the other
+# processes sharing the file add to it too.
+
+DEFAULT_PATH = 'http_cache.sqlite'
+DEFAULT_TTL = 3600  # seconds an entry is served without revalidation
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Date', 'Cache-Control')
+ACCESS_INTERVAL = 600  # seconds before a hit refreshes an entry's access time
+ACCESS_BATCH = 200
+SIZE_RECOUNT = 100
+
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # Several scraper processes may share the file (see run.py)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                digest TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL,
+                accessed_at REAL,
+                size INTEGER
+            )""")
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_size ON responses (size)')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS parsed (
+                url TEXT,
+                key TEXT,
+                digest TEXT,
+                value TEXT,
+                PRIMARY KEY (url, key)
+            )""")
+        self.conn.commit()
+        self.accessed = {}
+        self.stores = 0
+        self.total_bytes = self._count_bytes()
+
+    def _count_bytes(self):
+        return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def lookup(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT status, headers, body, digest, etag, last_modified, fetched_at, accessed_at '
+                'FROM responses WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - (row[7] or 0) > ACCESS_INTERVAL:
+                self.accessed[url] = now
+                if len(self.accessed) >= ACCESS_BATCH:
+                    self._write_accessed()
+                    self.conn.commit()
+        status, headers, body, digest, etag, last_modified, fetched_at, accessed_at = row
+        return {
+            'status': status,
+            'headers': json.loads(headers),
+            'body': body,
+            'digest': digest,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': fetched_at,
+        }
+
+    def _write_accessed(self):
+        # Part of the caller's transaction
+        self.conn.executemany('UPDATE responses SET accessed_at = ? WHERE url = ?',
+                              [(accessed_at, url) for url, accessed_at in self.accessed.items()])
+        self.accessed = {}
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched_at'] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, response):
+        body = response.content
+        headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, response.status_code, json.dumps(headers), body, hashlib.sha1(body).hexdigest(),
+                 response.headers.get('ETag'), response.headers.get('Last-Modified'), now, now, len(body)))
+            self.accessed.pop(url, None)
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            self.stores += 1
+            if self.stores % SIZE_RECOUNT == 0 or self.total_bytes > self.max_bytes:
+                self.total_bytes = self._count_bytes()
+            if self.total_bytes > self.max_bytes:
+                self._write_accessed()
+                self._evict()
+            self.conn.commit()
+
+    def touch(self, url):
+        # A 304 means the stored body is still current: restart its TTL.
+        with self.lock:
+            now = time.time()
+            self.accessed.pop(url, None)
+            self.conn.execute('UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+            self._write_accessed()
+            self.conn.commit()
+
+    def discard(self, url):
+        # Drops a body that turned out to be unusable (e.g. truncated)
+        with self.lock:
+            row = self.conn.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return
+            self.conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+            self.conn.execute('DELETE FROM parsed WHERE url = ?', (url,))
+            self.accessed.pop(url, None)
+            self.total_bytes -= row[0]
+            self.conn.commit()
+        logging.info(f"Dropped the cached response of {url}")
+
+    def _evict(self):
+        target = self.max_bytes * 0.9
+        evicted = 0
+        rows = self.conn.execute('SELECT url, size FROM responses ORDER BY accessed_at').fetchall()
+        for url, size in rows:
+            if self.total_bytes <= target:
+                break
+            self.conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+            self.conn.execute('DELETE FROM parsed WHERE url = ?', (url,))
+            self.total_bytes -= size
+            evicted += 1
+        logging.info(f"Evicted {evicted} cached responses, cache now {self.total_bytes} bytes")
+
+    def to_response(self, url, entry):
+        response = requests.Response()
+        response.status_code = entry['status']
+        response._content = entry['body']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = url
+        response.cache_key = url
+        response.from_cache = True
+        response.digest = entry['digest']
+        return response
+
+    def parsed(self, response, key, parse):
+        # Returns parse(response), reusing the stored result while the body is
+        # unchanged. Results must be JSON serialisable.
+        url = getattr(response, 'cache_key', response.url)
+        digest = getattr(response, 'digest', None) or hashlib.sha1(response.content).hexdigest()
+        with self.lock:
+            row = self.conn.execute('SELECT digest, value FROM parsed WHERE url = ? AND key = ?', (url, key)).fetchone()
+        if row and row[0] == digest:
+            return json.loads(row[1])
+        value = parse(response)
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)', (url, key, digest, json.dumps(value)))
+            self.conn.commit()
+        return value
+
+    def close(self):
+        with self.lock:
+            self._write_accessed()
+            self.conn.commit()
+            self.conn.close()
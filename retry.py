@@ -0,0 +1,109 @@
+import email.utils
+import logging
+import random
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+import http_client
+
+# Shared retry policy. Errors are classified (connect, timeout, throttled,
+# server, parse, client, other) and only the transient ones are retried, with
+# exponential backoff and full jitter. A Retry-After header from the server
+# overrides the computed delay and pauses the whole host in the rate limiter.
+# The fetch engine applies the policy asynchronously, so a URL waiting for its
+# next attempt does not hold a worker thread or a host slot.
+
+RETRYABLE = ('connect', 'timeout', 'throttled', 'server', 'parse')
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_BUDGET = 120.0  # total seconds a single URL may spend waiting on retries
+
+
+class ParseError(Exception):
+    pass
+
+
+def classify(error):
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return 'connect'
+    if isinstance(error, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return 'connect'
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status == 429:
+            return 'throttled'
+        if status >= 500:
+            return 'server'
+        return 'client'
+    # response.json() raises a RequestException that is also a ValueError
+    if isinstance(error, (ParseError, getattr(requests.exceptions, 'InvalidJSONError', ParseError))):
+        return 'parse'
+    # MissingSchema, InvalidURL, ... are ValueErrors too, but retrying cannot fix them
+    if isinstance(error, requests.exceptions.RequestException):
+        return 'other'
+    if isinstance(error, ValueError):
+        return 'parse'
+    return 'other'
+
+
+def retry_after_seconds(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY, budget=DEFAULT_BUDGET, retryable=RETRYABLE):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retryable = retryable
+
+    def next_delay(self, url, attempt, error, spent=0.0):
+        # Returns how long to wait before the next attempt, or None to give up.
+        kind = classify(error)
+        if kind not in self.retryable or attempt + 1 >= self.max_attempts:
+            return None
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+            http_client.get_client().limiter.pause(urlsplit(url).netloc, retry_after)
+
+        if spent + delay > self.budget:
+            logging.error(f"Retry budget exhausted for {url} after {attempt + 1} attempts ({kind}): {error}")
+            return None
+        logging.warning(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1}, {kind}): {error}")
+        return delay
+
+    def call(self, func, url, *args, **kwargs):
+        # Blocking variant for code paths that do not run on the fetch engine.
+        attempt = 0
+        spent = 0.0
+        while True:
+            try:
+                return func(url, *args, **kwargs)
+            except Exception as e:
+                delay = self.next_delay(url, attempt, e, spent)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                spent += delay
+                attempt += 1
@@ -1,3 +1,13 @@
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+
+import chrome_driver
 from ecom2 import MorfarsScraper
 from ecom3 import SpeedHobby_Scraper
 from ecom4 import RcklubbenScraper
@@ -5,145 +15,205 @@ from ecom5 import HobbyKarlScraper
 from ecom6 import ModelSportScraper
 from ecom7 import HoltEModelHobbyScraper
 
-def run_morfars_scraper():
+# Runs every site scraper at once, each in its own process with its own
+# browser, HTTP client and rate limits (the sites share no hosts). A shared
+# semaphore caps the number of browsers open across all sites, a site that
+# fails or crashes does not stop the others, and a combined summary is
+# printed at the end. With --incremental, products unchanged since the last
+# run are carried forward instead of fetched again.
+
+DEFAULT_MAX_BROWSERS = max(2, (os.cpu_count() or 2) // 2)
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def run_morfars_scraper(incremental=False):
     scraper = MorfarsScraper()
 
     url = 'https://morfars.dk/collections/all'
     product_urls = "morfars_product_urls.csv"
     product_details = "morfars_product_details.csv"
 
-    print("Starting MorfarsScraper...")
-    print("Extracting product links...")
-    scraper.extract_product_links(url, product_urls)
-    print("Product links extracted successfully.")
-
-    print("Extracting product details...")
-    scraper.extract_product_details(product_urls, product_details)
-    print("Product details extracted successfully.")
-
-    scraper.close_driver()
+    try:
+        print("Starting MorfarsScraper...")
+        # Details are fetched while links are still being discovered
+        scraper.run_pipeline(url, product_details, product_urls, incremental=incremental)
+        print("Product details extracted successfully.")
+    finally:
+        scraper.close_driver()
     print("MorfarsScraper execution completed.")
+    return product_details
 
-def run_speedhobby_scraper():
+def run_speedhobby_scraper(incremental=False):
     scraper = SpeedHobby_Scraper()
 
-    url = "https://speedhobby.se"
-    output_file = 'speedhobby_collections.csv'
-    product_urls = "speedhobby_urls.csv"
-    product_details = "speedhobby_details.csv"
-
-    print("Starting SpeedHobby_Scraper...")
-    print("Extracting collection links...")
-    scraper.extract_collection_links(output_file, url)
-    print("Collection links extracted successfully.")
-
-    print("Extracting product links...")
-    scraper.get_product_links(output_file, product_urls)
-    print("Product links extracted successfully.")
-
-    print("Extracting product details...")
-    scraper.extract_product_details(product_urls, product_details)
-    print("Product details extracted successfully.")
-
-    scraper.close_driver()
+    url = 'https://www.speedhobby.dk/collections/all'
+    product_urls = "speedhobby_product_urls.csv"
+    product_details = "speedhobby_product_details.csv"
+
+    try:
+        print("Starting SpeedHobby_Scraper...")
+        # Details are fetched while links are still being discovered
+        scraper.run_pipeline(url, product_details, product_urls, incremental=incremental)
+        print("Product details extracted successfully.")
+    finally:
+        scraper.close_driver()
     print("SpeedHobby_Scraper execution completed.")
+    return product_details
 
-def run_rcklubben_scraper():
+def run_rcklubben_scraper(incremental=False):
     scraper = RcklubbenScraper()
 
-    url = "https://rcklubben.se/"
-    output_file = 'rcklubben_collections.csv'
-    product_urls = "rcklubben_urls.csv"
-    product_details = "rcklubben_details.csv"
-
-    print("Starting RcklubbenScraper...")
-    print("Extracting collection links...")
-    scraper.extract_collection_links(output_file, url)
-    print("Collection links extracted successfully.")
-
-    print("Extracting product links...")
-    scraper.get_product_links(output_file, product_urls)
-    print("Product links extracted successfully.")
-
-    print("Extracting product details...")
-    scraper.extract_product_details(product_urls, product_details)
-    print("Product details extracted successfully.")
-
-    scraper.close_driver()
+    url = 'https://rcklubben.dk/collections/all'
+    product_urls = "rcklubben_product_urls.csv"
+    product_details = "rcklubben_product_details.csv"
+
+    try:
+        print("Starting RcklubbenScraper...")
+        # Details are fetched while links are still being discovered
+        scraper.run_pipeline(url, product_details, product_urls, incremental=incremental)
+        print("Product details extracted successfully.")
+    finally:
+        scraper.close_driver()
     print("RcklubbenScraper execution completed.")
+    return product_details
 
-def run_hobbykarl_scraper():
+def run_hobbykarl_scraper(incremental=False):
     scraper = HobbyKarlScraper()
 
     url = "https://hobbykarl.dk/sitemap/kategorier/"
     output_file = 'hobbykarl_collections.csv'
-    product_urls = "hobbykarl_urls.csv"
     product_details = "hobbykarl_details.csv"
 
-    print("Starting HobbyKarlScraper...")
-    print("Extracting collection links...")
-    scraper.extract_collection_links(output_file, url)
-    print("Collection links extracted successfully.")
-
-    print("Extracting product details...")
-    scraper.extract_product_details(output_file, product_details)
-    print("Product details extracted successfully.")
-
-    scraper.close_driver()
+    try:
+        print("Starting HobbyKarlScraper...")
+        # No sitemap lastmods here, so every run is a full crawl
+        scraper.extract_collection_links(output_file, url)
+        print("Collection links extracted successfully.")
+        scraper.extract_product_details(output_file, product_details)
+        print("Product details extracted successfully.")
+    finally:
+        scraper.close_driver()
     print("HobbyKarlScraper execution completed.")
+    return product_details
 
-def run_modelsport_scraper():
+def run_modelsport_scraper(incremental=False):
     scraper = ModelSportScraper()
-    
-    url = "https://modelsport.dk/"
+
     output_file = 'modelsport_collections.csv'
-    product_urls = "modelsport_urls.csv"
     product_details = "modelsport_details.csv"
-    
-    print("Starting ModelSportScraper...")
-    print("Extracting collection links...")
-    scraper.extract_collection_links(output_file, url)
-    print("Collection links extracted successfully.")
-
-    print("Extracting product links...")
-    scraper.get_product_links(output_file, product_urls)
-    print("Product links extracted successfully.")
 
-    print("Extracting product details...")
-    scraper.extract_product_details(product_urls, product_details)
-    print("Product details extracted successfully.")
-
-    scraper.close_driver()
+    try:
+        print("Starting ModelSportScraper...")
+        # Details are fetched while links are still being discovered
+        scraper.run_pipeline(product_details, output_file, incremental=incremental)
+        print("Product details extracted successfully.")
+    finally:
+        scraper.close_driver()
     print("ModelSportScraper execution completed.")
+    return product_details
 
-def run_holtemodelhobby_scraper():
+def run_holtemodelhobby_scraper(incremental=False):
     scraper = HoltEModelHobbyScraper()
 
-    url = "https://holtmodelhobby.dk/"
-    output_file = 'holtemodelhobby_collections.csv'
-    product_urls = "holtemodelhobby_urls.csv"
-    product_details = "holtemodelhobby_details.csv"
-
-    print("Starting HoltEModelHobbyScraper...")
-    print("Extracting collection links...")
-    scraper.extract_collection_links(output_file, url)
-    print("Collection links extracted successfully.")
-
-    print("Extracting product links...")
-    scraper.get_product_links(output_file, product_urls)
-    print("Product links extracted successfully.")
+    collection_file = 'holte-modelhobby_Product_url.csv'
+    product_details = "holte-modelhobby_details.csv"
 
-    print("Extracting product details...")
-    scraper.extract_product_details(product_urls, product_details)
-    print("Product details extracted successfully.")
-
-    scraper.close_driver()
+    try:
+        print("Starting HoltEModelHobbyScraper...")
+        # Details are fetched while links are still being discovered
+        scraper.run_pipeline(product_details, collection_file, incremental=incremental)
+        print("Product details extracted successfully.")
+    finally:
+        scraper.close_driver()
     print("HoltEModelHobbyScraper execution completed.")
+    return product_details
+
+# site name -> (runner, log file)
+SITES = {
+    'morfars': (run_morfars_scraper, 'MorfarsScraper.log'),
+    'speedhobby': (run_speedhobby_scraper, 'SpeedHobby_Scraper.log'),
+    'rcklubben': (run_rcklubben_scraper, 'RcklubbenScraper.log'),
+    'hobbykarl': (run_hobbykarl_scraper, 'HobbyKarlScraper.log'),
+    'modelsport': (run_modelsport_scraper, 'ModelSportScraper.log'),
+    'holtemodelhobby': (run_holtemodelhobby_scraper, 'HoltEModelHobbyScraper.log'),
+}
+
+
+def count_rows(path):
+    try:
+        with open(path, newline='', encoding='utf-8') as file:
+            return max(0, sum(1 for row in csv.reader(file) if row) - 1)
+    except OSError:
+        return 0
+
+
+def run_site(name, browser_slots, results, incremental=False):
+    # Process entry point: one site, its own log file, never raises.
+    runner, log_file = SITES[name]
+    logging.basicConfig(filename=log_file, level=logging.INFO, format=LOG_FORMAT, force=True)
+    chrome_driver.limit_browsers(browser_slots)
+    start = time.perf_counter()
+    result = {'site': name, 'status': 'ok', 'rows': 0, 'error': ''}
+    try:
+        result['rows'] = count_rows(runner(incremental))
+    except Exception as e:
+        logging.error(f"{name} failed: {traceback.format_exc()}")
+        result['status'] = 'failed'
+        result['error'] = repr(e)
+    result['seconds'] = time.perf_counter() - start
+    results.put(result)
+
+
+def run_all(sites=None, max_browsers=DEFAULT_MAX_BROWSERS, incremental=False):
+    sites = sites or list(SITES)
+    browser_slots = multiprocessing.BoundedSemaphore(max_browsers)
+    results = multiprocessing.Queue()
+    start = time.perf_counter()
+    processes = {}
+    for name in sites:
+        process = multiprocessing.Process(target=run_site, args=(name, browser_slots, results, incremental),
+                                          name=name)
+        process.start()
+        processes[name] = process
+
+    summary = {}
+    while len(summary) < len(processes):
+        try:
+            result = results.get(timeout=1)
+            summary[result['site']] = result
+        except queue.Empty:
+            # A process that died without reporting (e.g. killed) is a failure
+            for name, process in processes.items():
+                if name not in summary and not process.is_alive():
+                    summary[name] = {'site': name, 'status': 'crashed', 'rows': 0, 'seconds': 0.0,
+                                     'error': f"exit code {process.exitcode}"}
+    for process in processes.values():
+        process.join()
+
+    wall = time.perf_counter() - start
+    print_summary([summary[name] for name in sites], wall)
+    return summary
+
+
+def print_summary(results, wall):
+    print(f"{'Site':<18}{'Status':<9}{'Rows':>8}{'Time (s)':>10}  Error")
+    for result in results:
+        print(f"{result['site']:<18}{result['status']:<9}{result['rows']:>8}{result['seconds']:>10.0f}  {result['error']}")
+    total = sum(result['seconds'] for result in results)
+    failed = sum(1 for result in results if result['status'] != 'ok')
+    print(f"{len(results) - failed}/{len(results)} sites succeeded, "
+          f"{sum(result['rows'] for result in results)} rows, "
+          f"{wall:.0f} s wall time ({total:.0f} s if run one after another)")
+
 
 if __name__ == "__main__":
-    run_morfars_scraper()
-    run_speedhobby_scraper()
-    run_rcklubben_scraper()
-    run_hobbykarl_scraper()
-    run_modelsport_scraper()
-    run_holtemodelhobby_scraper()
+    parser = argparse.ArgumentParser(description="Run the site scrapers concurrently.")
+    parser.add_argument('sites', nargs='*', help=f"sites to run (default: all of {', '.join(SITES)})")
+    parser.add_argument('--browsers', type=int, default=DEFAULT_MAX_BROWSERS, help="maximum browsers open at once")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only re-extract products changed since the last run")
+    args = parser.parse_args()
+    unknown = set(args.sites) - set(SITES)
+    if unknown:
+        parser.error(f"unknown sites: {', '.join(sorted(unknown))}")
+    run_all(args.sites, args.browsers, args.incremental)
@@ -0,0 +1,130 @@
+import gzip
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urljoin, urlsplit
+from xml.etree import ElementTree
+
+import requests
+
+import http_client
+from retry import RetryPolicy
+
+# Sitemap driven URL discovery. sitemap.xml files (and sitemap indexes) are
+# streamed and parsed incrementally with iterparse, nested sitemaps are
+# fetched concurrently, and every page URL is yielded with its <lastmod> as
+# soon as its sitemap has been read. Scrapers fall back to their browser
+# crawl when a site has no sitemap. A sitemap that exists but cannot be read
+# makes discovery incomplete: discover() raises IncompleteDiscovery after the
+# last URL it could find, so callers do not take a partial list for the
+# whole site.
+
+DEFAULT_WORKERS = 8
+
+
+class IncompleteDiscovery(Exception):
+    pass
+
+
+def _missing(error):
+    # Not found, or some other page (not XML) served in its place
+    if isinstance(error, ElementTree.ParseError):
+        return True
+    return isinstance(error, requests.HTTPError) and error.response is not None \
+        and error.response.status_code in (404, 410)
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def sitemap_urls(url):
+    # Candidate sitemaps: the ones robots.txt announces, else /sitemap.xml.
+    parts = urlsplit(url)
+    root = f"{parts.scheme}://{parts.netloc}"
+    candidates = []
+    try:
+        response = http_client.get(f"{root}/robots.txt")
+        if response.status_code == 200:
+            for line in response.text.splitlines():
+                if line.lower().startswith('sitemap:'):
+                    candidates.append(urljoin(root, line.split(':', 1)[1].strip()))
+    except Exception as e:
+        logging.warning(f"Could not read robots.txt for {root}: {e}")
+    return candidates or [f"{root}/sitemap.xml"]
+
+
+def _open(url):
+    response = http_client.get(url, stream=True, cache=False)
+    response.raise_for_status()
+    return response
+
+
+def read_sitemap(url, retry_policy=None):
+    # Returns (child_sitemaps, [(loc, lastmod), ...]) for one sitemap file.
+    response = (retry_policy or RetryPolicy()).call(_open, url)
+    response.raw.decode_content = True
+    source = response.raw
+    if url.endswith('.gz') or 'gzip' in response.headers.get('Content-Type', ''):
+        source = gzip.GzipFile(fileobj=response.raw)
+
+    children, entries = [], []
+    try:
+        for _, element in ElementTree.iterparse(source, events=('end',)):
+            kind = _local_name(element.tag)
+            if kind not in ('url', 'sitemap'):
+                continue
+            fields = {_local_name(child.tag): (child.text or '').strip() for child in element}
+            if fields.get('loc'):
+                if kind == 'sitemap':
+                    children.append(fields['loc'])
+                else:
+                    entries.append((fields['loc'], fields.get('lastmod', '')))
+            element.clear()
+    finally:
+        response.close()
+    return children, entries
+
+
+def discover(url, sitemap_filter=None, url_filter=None, workers=DEFAULT_WORKERS):
+    # Yields (page_url, lastmod) for every page in the site's sitemaps.
+    # sitemap_filter picks which nested sitemaps to follow, url_filter which
+    # page URLs to keep. Yields nothing when the site has no sitemap.
+    retry_policy = RetryPolicy(max_attempts=3)
+    seen = set()
+    found = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+
+        def submit(sitemap_url):
+            if sitemap_url not in seen:
+                seen.add(sitemap_url)
+                pending[executor.submit(read_sitemap, sitemap_url, retry_policy)] = sitemap_url
+
+        roots = sitemap_urls(url)
+        for sitemap_url in roots:
+            submit(sitemap_url)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                sitemap_url = pending.pop(future)
+                try:
+                    children, entries = future.result()
+                except Exception as e:
+                    logging.warning(f"Could not read sitemap {sitemap_url}: {e}")
+                    # A missing top level sitemap only means the site has none
+                    if not (sitemap_url in roots and _missing(e)):
+                        failed.append(sitemap_url)
+                    continue
+                for child in children:
+                    if sitemap_filter is None or sitemap_filter(child):
+                        submit(child)
+                kept = [entry for entry in entries if url_filter is None or url_filter(entry[0])]
+                found += len(kept)
+                logging.info(f"Read {len(entries)} URLs and {len(children)} sitemaps from {sitemap_url}")
+                yield from kept
+
+    logging.info(f"Sitemap discovery found {found} URLs for {url}")
+    if failed:
+        raise IncompleteDiscovery(f"{len(failed)} sitemaps of {url} could not be read: {', '.join(failed)}")
@@ -0,0 +1,148 @@
+import csv
+import logging
+import sqlite3
+import time
+
+from output import KEY, is_placeholder, variant_key
+
+# Indexed product store. Every detail row is upserted, in batched
+# transactions, into one SQLite database shared by all sites and keyed by
+# (site, URL, variant key; see output.KEY), with indexes on brand and stock status. The database runs
+# in WAL mode, so reports can query it while crawls are writing. The CSV
+# layout stays available through the `details` view and export_csv().
+
+DEFAULT_PATH = 'catalog.sqlite'
+DEFAULT_BATCH_SIZE = 500
+
+COLUMNS = ['Title', 'Brand', 'Variants', 'SKU', 'Price', 'Stock Status', 'Quantity', 'URL']
+
+
+def connect(path=DEFAULT_PATH):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(products)')]
+    if columns and 'key' not in columns:
+        # A store keyed on (site, sku, url): every SKU-less variant of a page
+        # shared one row. The rows move to the keyed table below.
+        conn.execute('DROP VIEW IF EXISTS details')
+        conn.execute('DROP INDEX IF EXISTS products_brand')
+        conn.execute('DROP INDEX IF EXISTS products_stock')
+        conn.execute('ALTER TABLE products RENAME TO products_unkeyed')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            site TEXT,
+            url TEXT,
+            key TEXT,
+            sku TEXT,
+            title TEXT,
+            brand TEXT,
+            variant TEXT,
+            price TEXT,
+            stock TEXT,
+            quantity TEXT,
+            last_seen REAL,
+            PRIMARY KEY (site, url, key)
+        )""")
+    if columns and 'key' not in columns:
+        conn.execute("""
+            INSERT INTO products
+            SELECT site, url, sku, sku, title, brand, variant, price, stock, quantity, last_seen
+            FROM products_unkeyed""")
+        conn.execute('DROP TABLE products_unkeyed')
+    conn.execute('CREATE INDEX IF NOT EXISTS products_brand ON products (site, brand)')
+    conn.execute('CREATE INDEX IF NOT EXISTS products_stock ON products (site, stock)')
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS details AS
+        SELECT site, title AS "Title", brand AS "Brand", variant AS "Variants", sku AS "SKU",
+               price AS "Price", stock AS "Stock Status", quantity AS "Quantity", url AS "URL"
+        FROM products""")
+    conn.commit()
+    return conn
+
+
+class Store:
+    def __init__(self, site, path=DEFAULT_PATH, batch_size=DEFAULT_BATCH_SIZE):
+        self.site = site
+        self.batch_size = batch_size
+        self.conn = connect(path)
+        self.started = time.time()
+        self.pending = []
+        self.written = 0
+        self.closed = False
+
+    def write(self, row):
+        # row: a dict keyed by the output columns
+        if is_placeholder(row):
+            return
+        title = row.get('Title', row.get('Product Name', ''))
+        key = row.get(KEY) or variant_key(row)
+        self.pending.append((self.site, row['URL'], key, row.get('SKU', ''), title, row.get('Brand', ''),
+                             row.get('Variants', ''), str(row.get('Price', '')), str(row.get('Stock Status', '')),
+                             str(row.get('Quantity', '')), time.time()))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def keep(self, url):
+        # A page that failed this run: its rows are not pruned
+        self.conn.execute('UPDATE products SET last_seen = ? WHERE site = ? AND url = ?',
+                          (time.time(), self.site, url))
+        self.conn.commit()
+
+    def flush(self):
+        if self.closed or not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (site, url, key) DO UPDATE SET
+                    sku = excluded.sku, title = excluded.title, brand = excluded.brand, variant = excluded.variant,
+                    price = excluded.price, stock = excluded.stock, quantity = excluded.quantity,
+                    last_seen = excluded.last_seen""", self.pending)
+        self.written += len(self.pending)
+        self.pending = []
+
+    def finish(self, since=None, prune=True):
+        # Drops the site's rows not written since `since` (the crawl start),
+        # i.e. products that are gone. prune=False after a partial crawl.
+        self.flush()
+        if prune:
+            cursor = self.conn.execute('DELETE FROM products WHERE site = ? AND last_seen < ?',
+                                       (self.site, since or self.started))
+            self.conn.commit()
+            logging.info(f"Store: {self.written} rows of {self.site} upserted, {cursor.rowcount} stale rows removed")
+        self.close()
+
+    def close(self):
+        self.flush()
+        self.closed = True
+        self.conn.close()
+
+
+def export_csv(output_file, site=None, path=DEFAULT_PATH):
+    # Writes the stored rows (of one site, or all) in the CSV layout
+    conn = connect(path)
+    try:
+        query = 'SELECT site, ' + ', '.join(f'"{column}"' for column in COLUMNS) + ' FROM details'
+        rows = conn.execute(query + ' WHERE site = ?', (site,)) if site else conn.execute(query)
+        with open(output_file, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(COLUMNS if site else ['Site'] + COLUMNS)
+            count = 0
+            for row in rows:
+                writer.writerow(row[1:] if site else row)
+                count += 1
+    finally:
+        conn.close()
+    logging.info(f"Exported {count} rows to {output_file}")
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Export stored product details as CSV.")
+    parser.add_argument('output_file')
+    parser.add_argument('--site', help="only this site (default: all sites, with a Site column)")
+    parser.add_argument('--db', default=DEFAULT_PATH)
+    args = parser.parse_args()
+    print(f"Exported {export_csv(args.output_file, args.site, args.db)} rows to {args.output_file}")
@@ -0,0 +1,95 @@
+import logging
+from urllib.parse import urljoin
+
+import http_client
+import html_parser
+
+# Resolves the variants of a Smartweb product page (ModelSport, HoltE) over
+# plain HTTP, so the browser only has to click through variant buttons when
+# this does not work: every variant's input is sent to the form action the
+# variant buttons submit, and the "selected" price, SKU and stock are read
+# from the page that comes back with the selectors the browser uses. The
+# page's JSON-LD offers are not used: their raw prices and schema.org
+# availability do not match the browser's price text and stock labels (e.g.
+# HoltE's remote storage), and they are not tied to the variant inputs.
+
+VARIANT_BUTTONS = 'div.m-product-buttons-list-button.data'
+SELECTED_PRICE = 'span.selected-priceLine .price'
+SELECTED_SKU = 'span.product-itemNumber-value.selected-itemNumber-value'
+SELECTED_STOCK = 'span.product-stock-text.selected-stock-text'
+
+
+def _text(soup, selector):
+    element = soup.select_one(selector)
+    return element.get_text(strip=True) if element is not None else ""
+
+
+class VariantResolver:
+    def __init__(self, stock_status):
+        # stock_status maps a stock text element to the scraper's status label.
+        self.stock_status = stock_status
+
+    def resolve(self, url):
+        # Returns [[title, brand, sku, price, stock_status], ...] or None when
+        # the variants can only be read in the browser.
+        response = http_client.get(url)
+        response.raise_for_status()
+        page = http_client.parsed(response, 'smartweb-variants', lambda r: html_parser.extract(r.content, self.read_page))
+        if not page['variants']:
+            return None
+        rows = self.from_form(url, page)
+        if rows:
+            logging.info(f"Resolved {len(rows)} variants over HTTP for {url}")
+        return rows
+
+    def read_page(self, soup):
+        brand = soup.select_one('p.m-product-brand a.m-product-brand-link')
+        variants = []
+        form = None
+        for button in soup.select(VARIANT_BUTTONS):
+            field = button.select_one('input[name]')
+            if field is None:
+                continue
+            variants.append({'name': field['name'], 'value': field.get('value') or ''})
+        for form_element in soup.select('form'):
+            if form_element.select_one(VARIANT_BUTTONS) is not None:
+                form = {
+                    'action': form_element.get('action') or '',
+                    'method': (form_element.get('method') or 'get').lower(),
+                    'fields': {field['name']: field.get('value') or ''
+                               for field in form_element.select('input[type="hidden"][name]')},
+                }
+                break
+
+        return {
+            'title': _text(soup, 'h1.m-product-title.product-title') or "N/A",
+            'brand': brand['title'].split(': ')[-1] if brand is not None and brand.has_attr('title') else "N/A",
+            'variants': variants,
+            'form': form,
+        }
+
+    def from_form(self, url, page):
+        form = page['form']
+        if form is None or form['method'] != 'get':
+            return None
+        action = urljoin(url, form['action']) if form['action'] else url
+        rows = []
+        for variant in page['variants']:
+            params = dict(form['fields'])
+            params[variant['name']] = variant['value']
+            response = http_client.get(action, params=params, cache=False)
+            response.raise_for_status()
+            soup = html_parser.parse(response.content)
+            checked = soup.select_one(f'{VARIANT_BUTTONS} input[name][checked]')
+            if checked is not None and (checked['name'], checked.get('value') or '') != (variant['name'], variant['value']):
+                return None  # The page came back with another variant selected
+            sku = _text(soup, SELECTED_SKU)
+            if not sku:
+                return None
+            price = _text(soup, SELECTED_PRICE) or "N/A"
+            rows.append([page['title'], page['brand'], sku, price, self.stock_status(soup.select_one(SELECTED_STOCK))])
+        if len({row[2] for row in rows}) < len(rows):
+            # Every response showed the same SKU: the endpoint ignored the
+            # variant, so the selection really happens in JavaScript.
+            return None
+        return rows
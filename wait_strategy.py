@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Condition based waits for the browser stages. Each scraper declares, per
+# kind of page, the CSS selector and/or JavaScript expression that means the
+# page is ready (`Ready`), and the browser code waits for exactly that
+# instead of sleeping a fixed time. Every wait is timed, so the log shows how
+# long pages really took and which conditions timed out.
+
+DEFAULT_TIMEOUT = 15
+POLL_FREQUENCY = 0.1
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class Ready:
+    def __init__(self, selector=None, script=None, timeout=DEFAULT_TIMEOUT):
+        # selector: present once the page is usable; script: a JavaScript
+        # expression that is truthy once the page is usable.
+        self.selector = selector
+        self.script = script
+        self.timeout = timeout
+
+    def __call__(self, driver):
+        if self.selector and not driver.find_elements(By.CSS_SELECTOR, self.selector):
+            return False
+        if self.script and not driver.execute_script(f"return Boolean({self.script});"):
+            return False
+        return True
+
+
+def _record(name, elapsed, timed_out):
+    with _stats_lock:
+        count, total, longest, timeouts = _stats.get(name, (0, 0.0, 0.0, 0))
+        _stats[name] = (count + 1, total + elapsed, max(longest, elapsed), timeouts + timed_out)
+
+
+def wait(driver, ready, name='page', timeout=None):
+    # Waits until ready(driver) holds. Returns False (and logs) on timeout
+    # instead of raising, like the fixed sleeps it replaces.
+    timeout = timeout or getattr(ready, 'timeout', DEFAULT_TIMEOUT)
+    start = time.perf_counter()
+    timed_out = False
+    try:
+        # Errors while the page is still navigating count as "not ready yet"
+        WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY,
+                      ignored_exceptions=(WebDriverException,)).until(ready)
+    except TimeoutException:
+        timed_out = True
+        logging.warning(f"Timed out waiting for {name} on {driver.current_url}")
+    elapsed = time.perf_counter() - start
+    _record(name, elapsed, timed_out)
+    logging.debug(f"Waited {elapsed:.2f} s for {name}")
+    return not timed_out
+
+
+def load(driver, url, ready, name='page'):
+    driver.get(url)
+    return wait(driver, ready, name)
+
+
+def wait_for_replacement(driver, element, ready, name='page', timeout=None):
+    # After a click that navigates or re-renders a listing: waits until
+    # `element` (taken from the old page) is gone and the new page is ready.
+    def replaced(driver):
+        try:
+            element.is_enabled()
+            return False
+        except Exception:
+            return ready(driver)
+    return wait(driver, replaced, name, timeout or ready.timeout)
+
+
+def stats():
+    with _stats_lock:
+        return {name: {'count': count, 'avg_s': total / count, 'max_s': longest, 'timeouts': timeouts}
+                for name, (count, total, longest, timeouts) in _stats.items()}
+
+
+def log_stats():
+    for name, values in stats().items():
+        logging.info(f"Waits for {name}: {values['count']}, {values['avg_s']:.2f} s avg, "
+                     f"{values['max_s']:.2f} s max, {values['timeouts']} timeouts")